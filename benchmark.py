@@ -0,0 +1,493 @@
+# @copyright &copy; 2010 - 2018, Fraunhofer-Gesellschaft zur Foerderung der
+#   angewandten Forschung e.V. All rights reserved.
+#
+# BSD 3-Clause License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1.  Redistributions of source code must retain the above copyright notice,
+#     this list of conditions and the following disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+# 3.  Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# We kindly request you to use one or more of the following phrases to refer to
+# foxBMS in your hardware, software, documentation or advertising materials:
+#
+# &Prime;This product uses parts of foxBMS&reg;&Prime;
+#
+# &Prime;This product includes parts of foxBMS&reg;&Prime;
+#
+# &Prime;This product is derived from foxBMS&reg;&Prime;
+
+"""
+@file       benchmark.py
+@date       17.10.2026 (date of creation)
+@author     foxBMS Team
+@ingroup    tools
+@prefix     none
+@brief      benchmark of the bootstrap and build wrappers
+
+Times bootstrap.py and build.py against generated file:// remotes and a
+stand-in for waf, so that the results only depend on the wrappers
+"""
+import os
+import sys
+import argparse
+import json
+import logging
+import platform
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+import yaml
+
+sys.dont_write_bytecode = True
+import bootstrap
+
+__version__ = '0.1'
+__date__ = '2026-10-17'
+__updated__ = '2026-10-17'
+
+SETUP_FILES = ['bootstrap.py', 'build.py', 'wscript', '.config.yaml']
+"""list: Files of the setup repository that are copied into the workspace.
+"""
+STUB_WAF_NAME = 'waf-1.9.13'
+"""string: Name of the stand-in waf script in the tools repository.
+"""
+RELEASE_BRANCH = 'release'
+"""string: Branch of the remotes that carries the 'latest' tag.
+"""
+CHANGED_SOURCE = os.path.join('embedded-software', 'mcu-common', 'src',
+                              'source_0.c')
+"""string: Source file that is modified for the one-file-changed build.
+"""
+SCENARIOS = ['cold_bootstrap', 'warm_bootstrap', 'update_bootstrap',
+             'all_cold', 'noop_build', 'one_file_changed', 'all_warm']
+"""list: Scenarios in the order they are run in every repetition.
+"""
+LATENCIES = {'configure': 0.5, 'compile': 0.02, 'link': 0.2, 'doc': 1.0}
+"""dict: Default latencies of the stand-in waf in seconds.
+"""
+GIT_ENV = {'GIT_AUTHOR_NAME': 'benchmark',
+           'GIT_AUTHOR_EMAIL': 'benchmark@localhost',
+           'GIT_AUTHOR_DATE': '2018-01-01T00:00:00',
+           'GIT_COMMITTER_NAME': 'benchmark',
+           'GIT_COMMITTER_EMAIL': 'benchmark@localhost',
+           'GIT_COMMITTER_DATE': '2018-01-01T00:00:00'}
+"""dict: Fixed identity and dates, so that the remotes are reproducible.
+"""
+
+STUB_WAF = """#!/usr/bin/env python
+# Stand-in for waf generated by benchmark.py: simulates the latency of the
+# toolchain without compiling anything.
+import json
+import os
+import shutil
+import sys
+import time
+
+SOURCES = ['mcu-common', 'mcu-{}', 'mcu-freertos', 'mcu-hal']
+
+
+def latency(name):
+    return float(os.environ.get('FOXBMS_BENCH_' + name.upper(), 0))
+
+
+def build(variant, jobs):
+    state_file = os.path.join('build', variant, '.stub_state.json')
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except (IOError, ValueError):
+        state = {}
+    sources = {}
+    for src in SOURCES:
+        for root, dirs, files in os.walk(os.path.join(
+                'embedded-software', src.format(variant))):
+            for name in files:
+                if name.endswith('.c'):
+                    path = os.path.join(root, name)
+                    sources[path] = os.path.getmtime(path)
+    changed = [p for p in sources if state.get(p) != sources[p]]
+    if changed:
+        time.sleep(latency('compile') * -(-len(changed) // jobs))
+        time.sleep(latency('link'))
+    if not os.path.isdir(os.path.dirname(state_file)):
+        os.makedirs(os.path.dirname(state_file))
+    with open(state_file, 'w') as f:
+        json.dump(sources, f)
+    print('{} of {} files compiled'.format(len(changed), len(sources)))
+
+
+def main():
+    args = sys.argv[1:]
+    jobs = int(args[args.index('-j') + 1]) if '-j' in args else 1
+    lock_file = '.lock-waf_{}_build'.format(sys.platform)
+    for targ in args:
+        if targ.startswith('-') or targ.isdigit():
+            continue
+        if targ == 'distclean':
+            shutil.rmtree('build', ignore_errors=True)
+            if os.path.exists(lock_file):
+                os.remove(lock_file)
+        elif targ == 'configure':
+            time.sleep(latency('configure'))
+            if not os.path.isdir('build'):
+                os.makedirs('build')
+            open(lock_file, 'w').close()
+        elif targ.startswith('build_'):
+            build(targ[len('build_'):], jobs)
+        elif targ.startswith('clean_'):
+            shutil.rmtree(os.path.join('build', targ[len('clean_'):]),
+                          ignore_errors=True)
+        elif targ.startswith('doxygen_') or targ == 'sphinx':
+            time.sleep(latency('doc'))
+        else:
+            print('unknown command ' + targ)
+            return 1
+        print("'{}' finished successfully".format(targ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+"""
+
+STUB_WAF_FINDER = """#!/usr/bin/env python
+# Stand-in for tools/misc/autodetect_waf.py generated by benchmark.py.
+import os
+
+if __name__ == '__main__':
+    print('{{}} ({{}})'.format({!r}, os.path.join('tools', {!r})))
+""".format(STUB_WAF_NAME.split('-', 1)[1], STUB_WAF_NAME)
+
+
+def git(args, cwd):
+    """Runs git with the fixed identity and dates of GIT_ENV.
+    """
+    env = dict(os.environ)
+    env.update(GIT_ENV)
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(['git'] + args, cwd=cwd, env=env,
+                              stdout=devnull, stderr=devnull)
+
+
+def get_repo_files(name, n_files):
+    """Returns the content of a generated repository.
+
+    Args:
+        name (string): name of the repository.
+        n_files (int): number of source files of the embedded software
+            repositories.
+
+    Returns:
+        dict: content by path relative to the repository.
+    """
+    files = {'README.md': '# {}\n'.format(name)}
+    if name.startswith('mcu-'):
+        for i in range(n_files):
+            files[os.path.join('src', 'source_{}.c'.format(i))] = ''.join(
+                'int {}_{}_{}(void) {{ return {}; }}\n'.format(
+                    name.replace('-', '_'), i, j, j) for j in range(50))
+    elif name == 'tools':
+        files[STUB_WAF_NAME] = STUB_WAF
+        files[os.path.join('misc', 'autodetect_waf.py')] = STUB_WAF_FINDER
+    return files
+
+
+def create_remote(remotes_dir, name, n_files, tmp_dir):
+    """Creates a bare repository with a master branch and a release branch,
+    on which the annotated tag 'latest' is placed like on the real remotes.
+    """
+    work = os.path.join(tmp_dir, name)
+    os.makedirs(work)
+    git(['init', '-q'], work)
+    git(['checkout', '-q', '-b', 'master'], work)
+    for path, content in get_repo_files(name, n_files).items():
+        path = os.path.join(work, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+    git(['add', '-A'], work)
+    git(['commit', '-q', '-m', 'Initial commit'], work)
+    git(['checkout', '-q', '-b', RELEASE_BRANCH], work)
+    with open(os.path.join(work, 'RELEASE.md'), 'w') as f:
+        f.write('{} {}\n'.format(name, bootstrap.FOXBMSVERSION))
+    git(['add', '-A'], work)
+    git(['commit', '-q', '-m', 'Release'], work)
+    git(['tag', '-a', bootstrap.FOXBMSVERSION, '-m', 'Release'], work)
+    git(['clone', '-q', '--bare', work, os.path.join(
+        remotes_dir, name + bootstrap.BARE_EXTENSION)], tmp_dir)
+
+
+def move_remotes(remotes_dir):
+    """Adds a commit to the release branch of every remote and moves the tag
+    'latest' onto it, like a new release does.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for bare in sorted(os.listdir(remotes_dir)):
+            work = os.path.join(tmp_dir, bare)
+            git(['clone', '-q', '-b', RELEASE_BRANCH,
+                 os.path.join(remotes_dir, bare), work], tmp_dir)
+            with open(os.path.join(work, 'RELEASE.md'), 'a') as f:
+                f.write('update {}\n'.format(time.time()))
+            git(['commit', '-q', '-a', '-m', 'Update'], work)
+            git(['tag', '-a', '-f', bootstrap.FOXBMSVERSION, '-m', 'Update'],
+                work)
+            git(['push', '-q', '-f', 'origin', RELEASE_BRANCH,
+                 'refs/tags/' + bootstrap.FOXBMSVERSION], work)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def create_remotes(remotes_dir, n_files):
+    """Creates a remote for every repository of the .config.yaml.
+
+    Returns:
+        string: file:// URL of the remotes, see bootstrap --remote-base.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(remotes_dir)
+        # bootstrap.read_yaml creates the target directories, so the
+        # configuration is read directly
+        with open('.config.yaml', 'r') as stream:
+            conf = yaml.safe_load(stream)
+        for names in conf.values():
+            for name in names:
+                create_remote(remotes_dir, name, n_files, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 'file://' + os.path.abspath(remotes_dir).replace(os.sep, '/')
+
+
+def create_workspace(workspace):
+    """Copies the setup repository files into an empty workspace.
+    """
+    os.makedirs(workspace)
+    for name in SETUP_FILES:
+        shutil.copy2(name, os.path.join(workspace, name))
+
+
+def run_step(name, cmd, workspace, env):
+    """Runs one scenario and measures its wall clock time. The output is
+    written to benchmark_<name>.log in the workspace.
+
+    Returns:
+        float: duration in seconds.
+    """
+    log_file = os.path.join(workspace, 'benchmark_{}.log'.format(name))
+    logging.info('  %s: %s', name, ' '.join(cmd))
+    start = time.time()
+    with open(log_file, 'w') as log:
+        rtn_code = subprocess.call(cmd, cwd=workspace, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+    duration = time.time() - start
+    if rtn_code:
+        logging.error('%s failed with code %s, see %s', name, rtn_code,
+                      log_file)
+        sys.exit(1)
+    logging.info('  %s: %.2f s', name, duration)
+    return duration
+
+
+def run_repetition(work_dir, remotes_dir, remote_base, args):
+    """Runs all SCENARIOS with a new mirror cache. The cold bootstrap fills
+    the mirror cache, the warm bootstrap clones a second workspace from it,
+    and the update bootstrap fast-forwards this workspace after the remotes
+    moved. The builds run in the second workspace.
+
+    Returns:
+        dict: duration of every scenario.
+    """
+    repetition_dir = tempfile.mkdtemp(prefix='repetition-', dir=work_dir)
+    cold_workspace = os.path.join(repetition_dir, 'cold')
+    workspace = os.path.join(repetition_dir, 'workspace')
+    create_workspace(cold_workspace)
+    create_workspace(workspace)
+    env = dict(os.environ)
+    for key, value in LATENCIES.items():
+        env['FOXBMS_BENCH_' + key.upper()] = str(
+            getattr(args, key + '_latency'))
+    env.pop(bootstrap.MIRROR_CACHE_ENV, None)
+    bootstrap_cmd = [sys.executable, 'bootstrap.py', '-rb', remote_base,
+                     '-mc', os.path.join(repetition_dir, 'mirrors'), '-dbd',
+                     '-j', str(args.jobs)] + shlex.split(args.bootstrap_args)
+    build_cmd = [sys.executable, 'build.py', '-j', str(args.jobs)] + \
+        shlex.split(args.build_args)
+    times = {}
+    times['cold_bootstrap'] = run_step('cold_bootstrap', bootstrap_cmd,
+                                       cold_workspace, env)
+    times['warm_bootstrap'] = run_step('warm_bootstrap', bootstrap_cmd,
+                                       workspace, env)
+    move_remotes(remotes_dir)
+    times['update_bootstrap'] = run_step('update_bootstrap',
+                                         bootstrap_cmd + ['-u'], workspace,
+                                         env)
+    times['all_cold'] = run_step('all_cold', build_cmd + ['--all'],
+                                 workspace, env)
+    times['noop_build'] = run_step('noop_build', build_cmd + ['-p', '-s'],
+                                   workspace, env)
+    with open(os.path.join(workspace, CHANGED_SOURCE), 'a') as f:
+        f.write('/* changed by benchmark.py */\n')
+    # make sure the modification time differs on coarse file systems
+    mtime = os.path.getmtime(os.path.join(workspace, CHANGED_SOURCE)) + 2
+    os.utime(os.path.join(workspace, CHANGED_SOURCE), (mtime, mtime))
+    times['one_file_changed'] = run_step('one_file_changed',
+                                         build_cmd + ['-p', '-s'], workspace,
+                                         env)
+    times['all_warm'] = run_step('all_warm', build_cmd + ['--all'],
+                                 workspace, env)
+    if not args.keep:
+        shutil.rmtree(repetition_dir, ignore_errors=True)
+    return times
+
+
+def get_commit():
+    """Returns the commit of the setup repository that is benchmarked.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(runs):
+    """Computes the minimum and median of every scenario.
+
+    Args:
+        runs (list): durations of every repetition, see run_repetition.
+
+    Returns:
+        dict: runs, min and median by scenario.
+    """
+    summary = {}
+    for scenario in SCENARIOS:
+        values = sorted(run[scenario] for run in runs)
+        middle = len(values) // 2
+        median = values[middle] if len(values) % 2 else \
+            (values[middle - 1] + values[middle]) / 2.0
+        summary[scenario] = {'runs': [round(x, 3) for x in values],
+                             'min': round(values[0], 3),
+                             'median': round(median, 3)}
+    return summary
+
+
+def print_results(results, baseline=None):
+    """Prints the median of every scenario, and the change compared to the
+    results of another benchmark run if given.
+    """
+    print('{:<20} {:>10} {:>10}{}'.format(
+        'scenario', 'median', 'min', '   baseline  change' if baseline
+        else ''))
+    for scenario in SCENARIOS:
+        result = results['results'][scenario]
+        line = '{:<20} {:>9.2f}s {:>9.2f}s'.format(
+            scenario, result['median'], result['min'])
+        base = (baseline or {}).get('results', {}).get(scenario)
+        if base:
+            line += ' {:>9.2f}s {:>+7.1%}'.format(
+                base['median'],
+                (result['median'] - base['median']) / max(base['median'],
+                                                          1e-9))
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Times bootstrap.py and build.py ({}) against generated \
+file:// remotes and a stand-in waf that simulates the toolchain \
+latency'.format(', '.join(SCENARIOS)))
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of repetitions (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='result file (default: %(default)s)')
+    parser.add_argument('-c', '--compare', metavar='FILE',
+                        help='result file of another commit to compare with')
+    parser.add_argument('-w', '--work-dir',
+                        help='directory for the remotes and workspaces \
+(default: a temporary directory)')
+    parser.add_argument('-k', '--keep', action='store_true',
+                        help='keep the remotes and workspaces')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='jobs of bootstrap.py and build.py \
+(default: %(default)s)')
+    parser.add_argument('--files', type=int, default=50,
+                        help='source files per embedded software repository \
+(default: %(default)s)')
+    parser.add_argument('--bootstrap-args', default='',
+                        help='additional arguments of bootstrap.py')
+    parser.add_argument('--build-args', default='',
+                        help='additional arguments of build.py')
+    for key in sorted(LATENCIES):
+        parser.add_argument('--{}-latency'.format(key), type=float,
+                            default=LATENCIES[key],
+                            help='simulated {} time in seconds \
+(default: %(default)s)'.format(key))
+    parser.add_argument('-v', '--verbosity', action='count', default=0,
+                        help='increase output verbosity')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbosity else
+                        logging.WARNING, format='%(message)s')
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='foxbms-benchmark-')
+    work_dir = os.path.abspath(work_dir)
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    try:
+        logging.info('Creating the remotes in %s', work_dir)
+        remotes_dir = os.path.join(work_dir, 'remotes')
+        remote_base = create_remotes(remotes_dir, args.files)
+        runs = []
+        for i in range(args.repeat):
+            logging.info('Repetition %s of %s', i + 1, args.repeat)
+            runs.append(run_repetition(work_dir, remotes_dir, remote_base,
+                                       args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'commit': get_commit(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': dict((key, value) for key, value in vars(args).items()
+                         if key not in ['output', 'compare', 'work_dir',
+                                        'keep', 'verbosity']),
+        'results': summarize(runs),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -46,12 +46,22 @@ Helper script for setting up a foxBMS project
 """
 
 import argparse
+import errno
+import hashlib
+import json
 import logging
 import os
 import posixpath
+import shutil
+import signal
+import stat
 import subprocess
 import sys
+import threading
+import time
+import webbrowser
 import yaml
+from multiprocessing.pool import ThreadPool
 sys.dont_write_bytecode = True
 import build
 # 'import build' after 'sys.dont_write_bytecode = True' since otherwise
@@ -66,11 +76,73 @@ FOXBMSVERSION = 'latest'
 GIT_PROGRAM = 'git'
 GIT_CLONE = 'clone'
 
+LOCK_FILE = '.config.lock'
+"""string: Lock file with the commits of all repositories of the workspace.
+"""
+
 PRINT_MARK = '----------------------------------------------------------------------------'
 BARE_EXTENSION = '.git'
 """string: Extension of bare git repository.
 """
 
+REPO_CLONED = 'cloned'
+REPO_EXISTS = 'already exists'
+REPO_FAILED = 'failed'
+REPO_MISSING = 'missing'
+REPO_COMPLETE = 'complete'
+REPO_UNSHALLOWED = 'unshallowed'
+REPO_CHANGED = 'changed'
+REPO_UNCHANGED = 'unchanged'
+
+SHALLOW_DEPTH = 1
+"""int: Default history depth of shallow clones.
+"""
+SHALLOW_FILTER = 'blob:none'
+"""string: Default object filter of shallow clones, the blobs are fetched on
+demand when they are checked out.
+"""
+
+POOL_TIMEOUT = 24 * 60 * 60
+"""int: Upper limit in seconds for setting up all repositories in parallel.
+"""
+RESOLVE_JOBS = 16
+"""int: Maximum number of remotes that are queried at the same time.
+"""
+
+MIRROR_CACHE_ENV = 'FOXBMS_MIRROR_CACHE'
+"""string: Environment variable that sets the default mirror cache directory.
+"""
+MIRROR_CACHE_SIZE = 10 * 1024
+"""int: Default size limit of the mirror cache in MiB.
+"""
+MIRROR_LOCK_EXTENSION = '.lock'
+MIRROR_LOCK_TIMEOUT = 60 * 60
+"""int: Seconds after which a lock of a mirror is considered stale.
+"""
+DOC_MODE_NOW = 'now'
+DOC_MODE_BACKGROUND = 'background'
+DOC_MODE_LAZY = 'lazy'
+DOC_STEPS = [['--primary', '--doxygen'], ['--secondary', '--doxygen'],
+             ['--sphinx']]
+"""list: build.py calls that build the documentation, one after another.
+"""
+DOC_STATUS_FILE = '.documentation_status.json'
+"""string: State and progress of the documentation build.
+"""
+DOC_LOG_FILE = os.path.join('build', 'documentation.log')
+"""string: Output of the documentation build in the background.
+"""
+DOC_START_TIMEOUT = 60
+"""int: Seconds after which a queued documentation build whose process did
+not start is considered stale.
+"""
+DOC_PENDING = 'pending'
+DOC_QUEUED = 'queued'
+DOC_RUNNING = 'running'
+DOC_DONE = 'done'
+DOC_FAILED = 'failed'
+DOC_CANCELLED = 'cancelled'
+
 
 def read_yaml(foxconf='.config.yaml'):
     """
@@ -100,11 +172,73 @@ def read_yaml(foxconf='.config.yaml'):
     return repos
 
 
+def write_lock(repo_jobs, resolved=None, lock_file=LOCK_FILE):
+    """Writes the lock file with the checked out commit of every repository.
+
+    The entries are sorted, so the lock file is identical for identical
+    workspaces and can be used as a cache key.
+
+    Args:
+        repo_jobs (list): (repository name, repository path, target path) of
+            the repositories, see setup_repo_class.
+        resolved (dict): tags or branches of the repositories as resolved by
+            resolve_repos.
+        lock_file (string): path of the lock file.
+    """
+    entries = []
+    for repo_name, repo_path, repo_target_path in repo_jobs:
+        _cwd = os.path.join(repo_target_path, repo_name)
+        if not os.path.isdir(_cwd):
+            continue
+        branch, commit = read_head(_cwd)
+        if commit is None:
+            rtn_code, _out = run_git(['rev-parse', 'HEAD'], _cwd,
+                                     RepoLog(repo_name, buffered=True))
+            commit = _out.strip()
+        ref = None
+        if branch:
+            ref = 'refs/heads/' + branch
+        elif resolved and resolved.get(repo_name) and \
+                resolved[repo_name]['ref'] and \
+                not resolved[repo_name]['is_branch']:
+            ref = 'refs/tags/' + resolved[repo_name]['ref']
+        entries.append({'name': repo_name, 'path': repo_target_path,
+                        'url': repo_path, 'ref': ref, 'commit': commit})
+    entries.sort(key=lambda entry: (entry['path'], entry['name']))
+    with open(lock_file, 'w') as stream:
+        stream.write('# Commits of the foxBMS repositories, written by '
+                     'bootstrap.py\n')
+        yaml.safe_dump({'repositories': entries}, stream,
+                       default_flow_style=False)
+    logging.info('Wrote lock file \'%s\'', lock_file)
+
+
+def read_lock(lock_file=LOCK_FILE):
+    """Reads the lock file written by write_lock.
+
+    Returns:
+        tuple: (repository name, repository path, target path) of every
+            repository as used by setup_repos, and a dict repository name ->
+            lock file entry.
+    """
+    with open(lock_file, 'r') as stream:
+        entries = yaml.safe_load(stream)['repositories']
+    repo_jobs = []
+    locked = {}
+    for entry in entries:
+        if not os.path.isdir(entry['path']):
+            os.makedirs(entry['path'])
+        repo_jobs.append((entry['name'], entry['url'], entry['path']))
+        locked[entry['name']] = entry
+    return repo_jobs, locked
+
+
 def get_main_git_path():
     """Gets the remote URL of the setup repository.
 
     Returns:
-        string: remote URL of the setup-repository.
+        string: remote URL of the setup-repository, None if this is not a
+            git repository.
     """
     try:
         repository_basepath = subprocess.check_output(
@@ -120,7 +254,7 @@ Use
 to download the foxBMS-setup repository.
         '''.format(setup_dir_path)
         logging.error(err_msg)
-        sys.exit(1)
+        return None, None
     repository_basepath, repository_name = repository_basepath.rsplit('/', 1)
     return repository_basepath, repository_name
 
@@ -151,21 +285,663 @@ def print_next_steps_info(repo):
     logging.info(' Setting up \'%s\' repository', repo)
 
 
-def check_subprocess_exit(program, rtn_code):
+class RepoLog(object):
+    """Collects the log messages of a single repository.
+
+    When several repositories are set up at the same time, the messages are
+    buffered and written in one block once the repository is done, so the
+    output of different repositories is not interleaved.
+
+    Args:
+        repo_name (string): Repository the messages belong to.
+        buffered (bool): If False, messages are passed directly to logging.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, repo_name, buffered=False):
+        self.repo_name = repo_name
+        self.buffered = buffered
+        self.records = []
+
+    def log(self, level, msg, *args):
+        if self.buffered:
+            self.records.append((level, msg, args))
+        else:
+            logging.log(level, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, *args)
+
+    def flush(self):
+        """Writes all buffered messages in one block."""
+        with RepoLog._lock:
+            for level, msg, args in self.records:
+                logging.log(level, msg, *args)
+        self.records = []
+
+
+def check_subprocess_exit(program, rtn_code, log=logging):
+    """Logs the return code of a program.
+
+    Returns:
+        bool: True if the program finished successfully.
+    """
     if rtn_code == 0 or rtn_code is None:
-        logging.info('Success: Process return code of \'%s\' is \'%s\'',
-                     program, str(rtn_code))
+        log.info('Success: Process return code of \'%s\' is \'%s\'',
+                 program, str(rtn_code))
+        return True
+    log.error('Error: Process return code of \'%s\' is \'%s\'',
+              program, str(rtn_code))
+    return False
+
+
+def run_git(args, cwd, log=logging):
+    """Runs git with the given arguments and captures its output.
+
+    Args:
+        args (list): Arguments passed to git.
+        cwd (string): Working directory of the git process.
+        log (RepoLog): Log the command and its output is written to.
+
+    Returns:
+        tuple: Return code and standard output of the git process.
+    """
+    _cmd = [GIT_PROGRAM] + args
+    log.info('%s', ' '.join(_cmd))
+    proc = subprocess.Popen(_cmd, cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    _out, _err = proc.communicate()
+    if proc.returncode != 0 and _err:
+        log.error('%s', _err.strip())
+    return proc.returncode, _out
+
+
+def remove_repo(repo_dir):
+    """Removes a partially set up repository, so that a later bootstrap run
+    starts again from scratch instead of skipping it.
+    """
+    def _onerror(func, path, exc_info):
+        # git marks its object files read-only, which prevents deleting them
+        # on Windows
+        os.chmod(path, stat.S_IWRITE)
+        func(path)
+    if os.path.isdir(repo_dir):
+        shutil.rmtree(repo_dir, onerror=_onerror)
+
+
+class MirrorLock(object):
+    """Serializes access to a mirror in the cache, as several bootstrap runs
+    on the same host may use the same mirror at the same time.
+
+    The lock is a directory next to the mirror, as creating a directory is
+    atomic on all supported platforms.
+    """
+    def __init__(self, mirror_dir, log=logging):
+        self.lock_dir = mirror_dir + MIRROR_LOCK_EXTENSION
+        self.log = log
+
+    def __enter__(self):
+        waiting = False
+        while True:
+            try:
+                os.mkdir(self.lock_dir)
+                return self
+            except OSError:
+                if not os.path.isdir(self.lock_dir):
+                    raise
+            try:
+                age = time.time() - os.path.getmtime(self.lock_dir)
+            except OSError:
+                continue  # the lock has just been released
+            if age > MIRROR_LOCK_TIMEOUT:
+                self.log.warning('Removing stale lock \'%s\'', self.lock_dir)
+                try:
+                    os.rmdir(self.lock_dir)
+                except OSError:
+                    pass
+                continue
+            if not waiting:
+                self.log.info('Waiting for lock \'%s\'', self.lock_dir)
+                waiting = True
+            time.sleep(1)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        os.rmdir(self.lock_dir)
+
+
+def get_mirror_path(mirror_cache, repo_name, repo_path):
+    """Gets the directory of the bare mirror of a repository in the cache.
+
+    The remote URL is part of the name, so that repositories with the same
+    name but from different remotes do not share a mirror.
+
+    Args:
+        mirror_cache (string): mirror cache directory.
+        repo_name (string): name of the repository.
+        repo_path (string): remote URL of the repository.
+
+    Returns:
+        string: path of the mirror.
+    """
+    url_hash = hashlib.sha1(repo_path.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(mirror_cache, '{}-{}{}'.format(
+        repo_name, url_hash, BARE_EXTENSION))
+
+
+def update_mirror(repo_path, mirror_dir, log=logging):
+    """Creates or refreshes the bare mirror of a repository.
+
+    An existing mirror is refreshed by a single fetch, a new mirror is
+    cloned next to its final location and moved there when complete, so an
+    interrupted run never leaves a broken mirror behind.
+
+    Args:
+        repo_path (string): remote URL of the repository.
+        mirror_dir (string): path of the mirror in the cache.
+        log (RepoLog): Log the output is written to.
+
+    Returns:
+        bool: True if the mirror is up to date.
+    """
+    with MirrorLock(mirror_dir, log):
+        if os.path.isdir(mirror_dir):
+            log.info('Refreshing mirror \'%s\'', mirror_dir)
+            rtn_code, _out = run_git(['--git-dir', mirror_dir, 'fetch',
+                                      '--prune', 'origin'],
+                                     os.path.dirname(mirror_dir), log)
+        else:
+            log.info('Creating mirror \'%s\'', mirror_dir)
+            tmp_dir = mirror_dir + '.tmp'
+            remove_repo(tmp_dir)
+            rtn_code, _out = run_git(
+                [GIT_CLONE, '--mirror', repo_path, os.path.basename(tmp_dir)],
+                os.path.dirname(mirror_dir), log)
+            if rtn_code == 0:
+                os.rename(tmp_dir, mirror_dir)
+            else:
+                remove_repo(tmp_dir)
+        if rtn_code == 0:
+            # the modification time of the mirror is used for the eviction of
+            # the least recently used mirrors
+            os.utime(mirror_dir, None)
+    return rtn_code == 0
+
+
+def get_dir_size(path):
+    """Returns the size of all files below a directory in bytes.
+    """
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for _file in files:
+            try:
+                size += os.path.getsize(os.path.join(root, _file))
+            except OSError:
+                pass
+    return size
+
+
+def evict_mirrors(mirror_cache, max_size, keep=()):
+    """Removes the least recently used mirrors until the mirror cache is not
+    larger than max_size.
+
+    Args:
+        mirror_cache (string): mirror cache directory.
+        max_size (int): size limit of the mirror cache in MiB, 0 disables
+            the eviction.
+        keep (list): mirrors that are not removed, as they are in use.
+    """
+    if not max_size or not os.path.isdir(mirror_cache):
+        return
+    mirrors = []
+    for name in os.listdir(mirror_cache):
+        path = os.path.join(mirror_cache, name)
+        if name.endswith(BARE_EXTENSION) and os.path.isdir(path):
+            mirrors.append((os.path.getmtime(path), get_dir_size(path), path))
+    total = sum(size for mtime, size, path in mirrors)
+    for mtime, size, path in sorted(mirrors):
+        if total <= max_size * 1024 * 1024:
+            break
+        if path in keep:
+            continue
+        try:
+            with MirrorLock(path):
+                logging.info('Evicting mirror \'%s\' (%d MiB)', path,
+                             size // (1024 * 1024))
+                remove_repo(path)
+        except OSError as err:
+            logging.warning('Could not evict mirror \'%s\': %s', path, err)
+            continue
+        total -= size
+
+
+def get_repo_version(repo_name):
+    """Gets the tag or branch that is checked out for a repository.
+
+    Args:
+        repo_name (string): Repository name.
+
+    Returns:
+        string: tag or branch name.
+    """
+    version = 'master'  # fallback, as master always exists
+    for _rep in ['hw', 'mcu', 'tools', 'documentation']:
+        if _rep in repo_name:
+            version = FOXBMSVERSION
+    return version
+
+
+def get_remote_refs(repo_path, log=logging):
+    """Lists the branches and tags of a remote repository without cloning it.
+
+    Args:
+        repo_path (string): remote URL of the repository.
+        log (RepoLog): Log the output is written to.
+
+    Returns:
+        dict: {'heads': {branch: commit}, 'tags': {tag: commit}} or None if
+            the remote could not be queried. Annotated tags are resolved to
+            the commit they point to.
+    """
+    rtn_code, _out = run_git(['ls-remote', '--heads', '--tags', repo_path],
+                             '.', log)
+    if rtn_code != 0:
+        return None
+    refs = {'heads': {}, 'tags': {}}
+    peeled = {}
+    for line in _out.splitlines():
+        try:
+            sha, ref = line.split('\t', 1)
+        except ValueError:
+            continue
+        if ref.startswith('refs/heads/'):
+            refs['heads'][ref[len('refs/heads/'):]] = sha
+        elif ref.startswith('refs/tags/'):
+            tag = ref[len('refs/tags/'):]
+            if tag.endswith('^{}'):
+                peeled[tag[:-len('^{}')]] = sha
+            else:
+                refs['tags'][tag] = sha
+    refs['tags'].update(peeled)
+    return refs
+
+
+def resolve_ref(refs, version, log=logging):
+    """Resolves the tag or branch that is checked out from the remote refs.
+
+    A tag is resolved to a branch whose head is the tagged commit, 'master'
+    being preferred. If no such branch exists, the tag itself is used.
+
+    Args:
+        refs (dict): remote refs as returned by get_remote_refs.
+        version (string): tag or branch name.
+        log (RepoLog): Log the output is written to.
+
+    Returns:
+        string: branch or tag name, None if the version does not exist.
+    """
+    if version in refs['heads']:
+        return version
+    commit = refs['tags'].get(version)
+    if commit is None:
+        return None
+    branches = sorted(branch for branch, sha in refs['heads'].items()
+                      if sha == commit)
+    if 'master' in branches:
+        branches.insert(0, 'master')
+    if branches:
+        log.info('Found tag \'%s\' in \'%s\'', version, branches[0])
+        return branches[0]
+    log.info('Found tag \'%s\'', version)
+    return version
+
+
+def clone_repo_shallow(repo_name, repo_path, repo_target_path, version,
+                       depth, clone_filter, log=logging, ref=None):
+    """Clones only the resolved tag or branch of a repository with a limited
+    history depth and an object filter.
+
+    Args:
+        repo_name (string): Repository name that is cloned.
+        repo_path (string): Repository path from where the repository is
+            cloned.
+        repo_target_path (string): Directory the repository is cloned into.
+        version (string): tag or branch that is checked out.
+        depth (int): number of commits of history that is cloned.
+        clone_filter (string): object filter (see 'git help rev-list'),
+            None clones all objects of the history.
+        log (RepoLog): Log the output is written to.
+        ref (string): tag or branch resolved up front by resolve_repos, if
+            None the version is resolved here.
+
+    Returns:
+        string: REPO_CLONED or REPO_FAILED
+    """
+    if ref is None:
+        log.info('Searching tag \'%s\'', version)
+        refs = get_remote_refs(repo_path, log)
+        if refs is None:
+            return REPO_FAILED
+        ref = resolve_ref(refs, version, log)
+    if ref is None:
+        log.warning('The tag \'%s\' might not exist.', version)
+        log.warning('Using \'master\' branch instead.')
+        ref = 'master'
+    _clone_args = ['--depth', str(depth), '--branch', ref, '--single-branch']
+    if clone_filter:
+        _clone_args.extend(['--filter', clone_filter])
+    rtn_code, _out = run_git([GIT_CLONE] + _clone_args +
+                             [repo_path, repo_name], repo_target_path, log)
+    if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+        remove_repo(os.path.join(repo_target_path, repo_name))
+        return REPO_FAILED
+    log.info('\n')
+    return REPO_CLONED
+
+
+def resolve_repos(repo_jobs, events=None):
+    """Resolves the tag or branch of every repository before anything is
+    cloned.
+
+    The refs of all remotes are queried at the same time with one
+    'git ls-remote' per remote. The tag of each repository is then resolved
+    from these refs (tag -> commit -> branch), so that the repositories can
+    be cloned directly at the resolved branch and missing tags are reported
+    before any data is downloaded.
+
+    Args:
+        repo_jobs (list): (repository name, repository path, target path) of
+            the repositories, see setup_repo_class.
+        events (build.EventStream): event stream of the run, None if the
+            events are not recorded.
+
+    Returns:
+        dict: repository name -> {'version': tag or branch name, 'ref':
+            resolved branch or tag, 'commit': commit of ref, 'is_branch':
+            True if ref is a branch}. None for repositories whose remote
+            could not be queried. Repositories in which neither the tag nor
+            the master branch exist have an additional 'error'.
+    """
+    def _query(repo_job):
+        repo_name, repo_path, _target_path = repo_job
+        log = RepoLog(repo_name, buffered=True)
+        return repo_name, get_remote_refs(repo_path, log), log
+
+    events = events or build.EventStream()
+    resolved = {}
+    if not repo_jobs:
+        return resolved
+    start = time.time()
+    pool = ThreadPool(min(RESOLVE_JOBS, len(repo_jobs)))
+    try:
+        queried = pool.map_async(_query, repo_jobs).get(POOL_TIMEOUT)
+    finally:
+        pool.close()
+        pool.join()
+
+    logging.info(PRINT_MARK)
+    logging.info('Resolving the tags of %d repositories', len(repo_jobs))
+    logging.info(PRINT_MARK)
+    for repo_name, refs, log in queried:
+        if refs is None:
+            log.flush()
+            logging.warning('Could not query the remote of \'%s\', the tag '
+                            'is searched after cloning.', repo_name)
+            resolved[repo_name] = None
+            continue
+        version = get_repo_version(repo_name)
+        ref = resolve_ref(refs, version, log)
+        log.flush()
+        if ref is None:
+            logging.warning('The tag \'%s\' does not exist in \'%s\'.',
+                            version, repo_name)
+            logging.warning('Using \'master\' branch instead.')
+            ref = 'master'
+        is_branch = ref in refs['heads']
+        commit = refs['heads'].get(ref) if is_branch else \
+            refs['tags'].get(ref)
+        if commit is None:
+            # neither the tag nor the master branch exist, the repository
+            # is reported as failed by setup_repos
+            logging.error('Neither \'%s\' nor \'%s\' exist in \'%s\'.',
+                          version, ref, repo_name)
+            resolved[repo_name] = {'version': version, 'ref': None,
+                                   'commit': None, 'is_branch': False,
+                                   'error': 'unresolved'}
+            continue
+        resolved[repo_name] = {'version': version, 'ref': ref,
+                               'commit': commit, 'is_branch': is_branch}
+        logging.info('  %-30s %s -> %s (%s)', repo_name, version, ref,
+                     (commit or '')[:7])
+    logging.info(PRINT_MARK)
+    events.emit('resolve', repos=len(repo_jobs),
+                duration=round(time.time() - start, 3))
+    return resolved
+
+
+def unshallow_repo(repo_name, repo_path, repo_target_path, log=logging):
+    """Fetches the complete history and all branches of a repository that
+    has been cloned shallow.
+
+    Blobs that have been left out by the object filter of the clone are
+    fetched when they are needed.
+
+    Args:
+        repo_name (string): Repository name.
+        repo_path (string): Repository path from where the repository has
+            been cloned.
+        repo_target_path (string): Directory the repository is cloned into.
+        log (RepoLog): Log the output is written to.
+
+    Returns:
+        string: REPO_UNSHALLOWED, REPO_COMPLETE, REPO_MISSING or REPO_FAILED
+    """
+    _cwd = os.path.join(repo_target_path, repo_name)
+    if not os.path.isdir(_cwd):
+        log.warning('repository \'%s\' does not exist', repo_name)
+        return REPO_MISSING
+    rtn_code, _out = run_git(['rev-parse', '--is-shallow-repository'], _cwd,
+                             log)
+    if rtn_code != 0:
+        return REPO_FAILED
+    if _out.strip() != 'true':
+        log.info('repository \'%s\' is not shallow', repo_name)
+        return REPO_COMPLETE
+    log.info('Fetching the complete history of \'%s\'', repo_name)
+    for _args in (['remote', 'set-branches', 'origin', '*'],
+                  ['fetch', '--unshallow', '--tags', 'origin']):
+        rtn_code, _out = run_git(_args, _cwd, log)
+        if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+            return REPO_FAILED
+    return REPO_UNSHALLOWED
+
+
+def read_head(repo_dir):
+    """Reads the checked out branch and commit of a repository directly from
+    its git directory, without starting a git process.
+
+    Args:
+        repo_dir (string): working directory of the repository.
+
+    Returns:
+        tuple: branch (None if detached) and commit (None if it could not be
+            read).
+    """
+    git_dir = os.path.join(repo_dir, '.git')
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r') as stream:
+            head = stream.read().strip()
+    except IOError:
+        return None, None
+    if not head.startswith('ref: '):
+        return None, head
+    ref = head[len('ref: '):]
+    branch = ref[len('refs/heads/'):]
+    try:
+        with open(os.path.join(git_dir, *ref.split('/')), 'r') as stream:
+            return branch, stream.read().strip()
+    except IOError:
+        pass
+    try:
+        with open(os.path.join(git_dir, 'packed-refs'), 'r') as stream:
+            for line in stream:
+                if line.strip().endswith(' ' + ref):
+                    return branch, line.split(' ', 1)[0]
+    except IOError:
+        pass
+    return branch, None
+
+
+def update_repo(repo_name, repo_path, repo_target_path, log=logging,
+                mirror_dir=None, resolved=None):
+    """Fast-forwards an existing repository if its resolved tag or branch
+    has moved on the remote.
+
+    The commit on the remote is known from resolve_repos, so repositories
+    that are up to date are skipped without fetching anything. With a
+    mirror cache, the mirror is refreshed first and the repository fetches
+    from it, so that a lock file written afterwards only names commits that
+    checkout_locked finds in the mirror.
+
+    Args:
+        repo_name (string): Repository name.
+        repo_path (string): Repository path from where the repository has
+            been cloned.
+        repo_target_path (string): Directory the repository is cloned into.
+        log (RepoLog): Log the output is written to.
+        mirror_dir (string): Bare mirror of the repository in the mirror
+            cache, or None.
+        resolved (dict): tag or branch of the repository as resolved by
+            resolve_repos.
+
+    Returns:
+        string: REPO_CHANGED, REPO_UNCHANGED, REPO_MISSING or REPO_FAILED,
+            followed by the commits.
+    """
+    _cwd = os.path.join(repo_target_path, repo_name)
+    if not os.path.isdir(_cwd):
+        log.warning('repository \'%s\' does not exist', repo_name)
+        return REPO_MISSING
+    if not resolved or not resolved['commit']:
+        log.error('The remote of \'%s\' could not be resolved', repo_name)
+        return REPO_FAILED
+    source = 'origin'
+    if mirror_dir:
+        if update_mirror(repo_path, mirror_dir, log):
+            source = mirror_dir
+        else:
+            log.warning('Updating \'%s\' without mirror', repo_name)
+    branch, commit = read_head(_cwd)
+    if commit is None:
+        rtn_code, _out = run_git(['rev-parse', 'HEAD'], _cwd, log)
+        commit = _out.strip()
+    ref = resolved['ref']
+    if commit == resolved['commit']:
+        log.info('\'%s\' is up to date', repo_name)
+        return '{} ({})'.format(REPO_UNCHANGED, commit[:7])
+
+    log.info('Updating \'%s\' to \'%s\'', repo_name, ref)
+    if resolved['is_branch']:
+        _cmds = [['fetch', source, '+refs/heads/{0}:refs/remotes/origin/{0}'
+                  .format(ref)]]
+        if branch != ref:
+            _cmds.append(['checkout', ref])
+        _cmds.append(['merge', '--ff-only', 'origin/' + ref])
     else:
-        logging.error('Error: Process return code of \'%s\' is \'%s\'',
-                      program, str(rtn_code))
-        logging.error('Exiting...')
-        sys.exit(1)
+        _cmds = [['fetch', source, '+refs/tags/{0}:refs/tags/{0}'
+                  .format(ref)],
+                 ['checkout', '--detach', ref]]
+    for _args in _cmds:
+        rtn_code, _out = run_git(_args, _cwd, log)
+        if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+            return REPO_FAILED
+    return '{} ({} -> {})'.format(REPO_CHANGED, commit[:7],
+                                  resolved['commit'][:7])
+
+
+def checkout_locked(repo_name, repo_path, repo_target_path, log=logging,
+                    mirror_dir=None, resolved=None):
+    """Checks out the commit of a repository recorded in the lock file.
+
+    No refs are resolved. If the commit is in the mirror cache, the
+    repository is cloned from the mirror without contacting the remote.
+
+    Args:
+        repo_name (string): Repository name.
+        repo_path (string): Repository path from where the repository is
+            cloned.
+        repo_target_path (string): Directory the repository is cloned into.
+        log (RepoLog): Log the output is written to.
+        mirror_dir (string): Bare mirror of the repository in the mirror
+            cache.
+        resolved (dict): lock file entry of the repository, see read_lock.
+
+    Returns:
+        string: REPO_CLONED, REPO_CHANGED, REPO_UNCHANGED or REPO_FAILED
+    """
+    commit = resolved['commit']
+    _cwd = os.path.join(repo_target_path, repo_name)
+    if os.path.isdir(_cwd):
+        branch, head = read_head(_cwd)
+        if head == commit:
+            return '{} ({})'.format(REPO_UNCHANGED, commit[:7])
+        _cmds = [['checkout', '--detach', commit]]
+        rtn_code, _out = run_git(['cat-file', '-e', commit + '^{commit}'],
+                                 _cwd, log)
+        if rtn_code != 0:
+            _cmds.insert(0, ['fetch', 'origin'])
+        result = '{} ({} -> {})'.format(REPO_CHANGED, (head or '')[:7],
+                                        commit[:7])
+    else:
+        source = repo_path
+        if mirror_dir and os.path.isdir(mirror_dir):
+            rtn_code, _out = run_git(['--git-dir', mirror_dir, 'cat-file',
+                                      '-e', commit + '^{commit}'],
+                                     repo_target_path, log)
+            if rtn_code == 0:
+                source = mirror_dir
+        log.info('Cloning foxBMS repository \'%s\' from %s', repo_name,
+                 source)
+        rtn_code, _out = run_git([GIT_CLONE, '--no-checkout', source,
+                                  repo_name], repo_target_path, log)
+        if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+            remove_repo(_cwd)
+            return REPO_FAILED
+        _cmds = []
+        if source != repo_path:
+            _cmds.append(['remote', 'set-url', 'origin', repo_path])
+        ref = resolved.get('ref') or ''
+        if ref.startswith('refs/heads/'):
+            _cmds.append(['checkout', '-B', ref[len('refs/heads/'):],
+                          commit])
+        else:
+            _cmds.append(['checkout', '--detach', commit])
+        result = REPO_CLONED
+    for _args in _cmds:
+        rtn_code, _out = run_git(_args, _cwd, log)
+        if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+            if result == REPO_CLONED:
+                remove_repo(_cwd)
+            return REPO_FAILED
+    return result
 
 
-def clone_repo(repo_name, repo_path, repo_target_path):
+def clone_repo(repo_name, repo_path, repo_target_path, log=logging,
+               mirror_dir=None, depth=None, clone_filter=None, resolved=None):
     """Clones a specified repository
 
-    - We clone the master branch
+    - If the tag or branch has been resolved up front (see resolve_repos),
+      we clone it directly; a tag that is not the head of a branch is
+      checked out detached, like update_repo does
+    - Otherwise we clone the master branch
     - We check which branch contains the tag 'latest'
     - We checkout this branch
 
@@ -173,64 +949,95 @@ def clone_repo(repo_name, repo_path, repo_target_path):
         repo_name (string): Repository name that is cloned.
         repo_path (string): Repository path from where the repository is
             cloned.
+        repo_target_path (string): Directory the repository is cloned into.
+        log (RepoLog): Log the output of the setup process is written to.
+        mirror_dir (string): Bare mirror of the repository in the mirror
+            cache. If given, the mirror is refreshed and the objects are
+            copied from it instead of downloading them from the remote.
+        depth (int): If given, only the resolved tag or branch is cloned
+            with this history depth, see clone_repo_shallow.
+        clone_filter (string): object filter of shallow clones.
+        resolved (dict): tag or branch of the repository as resolved by
+            resolve_repos.
+
+    Returns:
+        string: REPO_CLONED, REPO_EXISTS or REPO_FAILED
     """
-    version = 'master'  # fallback, as master always exists
+    version = get_repo_version(repo_name)
     latest_tag_missing = True
-    for _rep in ['hw', 'mcu', 'tools', 'documentation']:
-        if _rep in repo_name:
-            version = FOXBMSVERSION
 
     if os.path.isdir(os.path.join(repo_target_path, repo_name)):
-        logging.error('repository \'{}\' already exists'.format(repo_name))
-        pass  # we might still setup other repos
-    else:
-        # repository does not exist locally, therefore we clone
-        logging.info('Cloning foxBMS repository \'%s\' from remote %s',
-                     repo_name, repo_path)
-        _action = GIT_CLONE
-        _cwd = os.path.join(repo_target_path)
-        # first we clone the master
-        _cmd = '{} {} {}'.format(GIT_PROGRAM, _action, repo_path).strip()
-        logging.info('%s', _cmd)
-        rtn_code = subprocess.call(_cmd, cwd=_cwd)
-        check_subprocess_exit(GIT_PROGRAM, rtn_code)
-        # We start the search for the 'latest' tag and checkout the resulting
-        # branch
-        _cwd = os.path.join(repo_target_path, repo_name)
-        logging.info('Searching tag \'%s\'', version)
-        _cmd = '{} branch --all --contains {}'.format(GIT_PROGRAM, version).strip()
-        logging.info('%s', _cmd)
-        a = subprocess.Popen(_cmd, cwd=_cwd, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        _out, _err = a.communicate()
-        latest_branch = 'master'
-        try:
-            _out = _out.replace('*', '')
-            _out = _out.strip()
-            _out = _out.replace(' ', '')
-            for line in _out.split('\n'):
-                if latest_tag_missing is True:
-                    b = line.split('/')[-1]
-                    if b != '':
-                        latest_branch = b
-                        latest_tag_missing = False
-                        logging.info('Found tag \'%s\' in \'%s\'', version, latest_branch)
-        except IndexError as ierr:
-            logging.warning('The tag \'%s\' might not exist.', version)
-            logging.warning('Using \'master\' branch instead.')
-        except BaseException:
-            logging.error('Something undefined went wrong.')
-            logging.warning('Using \'master\' branch instead.')
-        if latest_tag_missing is True:
-            logging.warning('The tag \'%s\' might not exist.', version)
-            logging.warning('Using \'master\' branch instead.')
+        log.error('repository \'{}\' already exists'.format(repo_name))
+        return REPO_EXISTS  # we might still setup other repos
+
+    # repository does not exist locally, therefore we clone
+    log.info('Cloning foxBMS repository \'%s\' from remote %s',
+             repo_name, repo_path)
+    if depth:
+        if mirror_dir:
+            log.info('Shallow clones do not use the mirror cache')
+        return clone_repo_shallow(repo_name, repo_path, repo_target_path,
+                                  version, depth, clone_filter, log,
+                                  resolved and resolved['ref'])
+    _clone_args = []
+    if mirror_dir:
+        if update_mirror(repo_path, mirror_dir, log):
+            # --dissociate makes the clone independent of the mirror, so that
+            # evicting the mirror does not break the workspace
+            _clone_args = ['--reference', mirror_dir, '--dissociate']
+        else:
+            log.warning('Cloning \'%s\' without mirror', repo_name)
+    if resolved and resolved['ref']:
+        # the branch or tag is known, so it is checked out by the clone itself
+        rtn_code, _out = run_git([GIT_CLONE] + _clone_args +
+                                 ['--branch', resolved['ref'], repo_path,
+                                  repo_name], repo_target_path, log)
+        if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+            remove_repo(os.path.join(repo_target_path, repo_name))
+            return REPO_FAILED
+        log.info('\n')
+        return REPO_CLONED
+    # first we clone the master
+    rtn_code, _out = run_git([GIT_CLONE] + _clone_args +
+                             [repo_path, repo_name], repo_target_path, log)
+    if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+        remove_repo(os.path.join(repo_target_path, repo_name))
+        return REPO_FAILED
+    # We start the search for the 'latest' tag and checkout the resulting
+    # branch
+    _cwd = os.path.join(repo_target_path, repo_name)
+    log.info('Searching tag \'%s\'', version)
+    rtn_code, _out = run_git(['branch', '--all', '--contains', version],
+                             _cwd, log)
+    latest_branch = 'master'
+    try:
+        _out = _out.replace('*', '')
+        _out = _out.strip()
+        _out = _out.replace(' ', '')
+        for line in _out.split('\n'):
+            if latest_tag_missing is True:
+                b = line.split('/')[-1]
+                if b != '':
+                    latest_branch = b
+                    latest_tag_missing = False
+                    log.info('Found tag \'%s\' in \'%s\'', version,
+                             latest_branch)
+    except IndexError as ierr:
+        log.warning('The tag \'%s\' might not exist.', version)
+        log.warning('Using \'master\' branch instead.')
+    except BaseException:
+        log.error('Something undefined went wrong.')
+        log.warning('Using \'master\' branch instead.')
+    if latest_tag_missing is True:
+        log.warning('The tag \'%s\' might not exist.', version)
+        log.warning('Using \'master\' branch instead.')
 
-        _cmd = '{} checkout {}'.format(GIT_PROGRAM, latest_branch).strip()
-        logging.info('%s', _cmd)
-        rtn_code = subprocess.call(_cmd, cwd=_cwd, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-        check_subprocess_exit(GIT_PROGRAM, rtn_code)
-        print '\n'
+    rtn_code, _out = run_git(['checkout', latest_branch], _cwd, log)
+    if not check_subprocess_exit(GIT_PROGRAM, rtn_code, log):
+        remove_repo(_cwd)
+        return REPO_FAILED
+    log.info('\n')
+    return REPO_CLONED
 
 
 def setup_repo_class(repo_names, repo_paths, repo_target_path, setup_info):
@@ -240,18 +1047,170 @@ def setup_repo_class(repo_names, repo_paths, repo_target_path, setup_info):
         repo_names (list): names of the repositories that will be setup.
         repo_paths (list): paths to the repositories that will be setup.
         setup_info (string): Initial information that will be printed
+
+    Returns:
+        list: (repository name, repository path, target path) of every
+            repository that will be setup.
     """
     logging.info('\nSetting up the foxBMS %s dependencies', setup_info)
     logging.info(PRINT_MARK)
     for repo in repo_names:
         print_next_steps_info(repo)
     logging.info(PRINT_MARK)
-    for repo, repo_path in zip(repo_names, repo_paths):
-        clone_repo(repo, repo_path, repo_target_path)
-    logging.info('done...\n')
+    return [(repo, repo_path, repo_target_path)
+            for repo, repo_path in zip(repo_names, repo_paths)]
+
+
+def setup_repos(repo_jobs, jobs=1, mirror_cache=None, action=clone_repo,
+                resolved=None, events=None, **kwargs):
+    """Sets up all repositories, up to 'jobs' of them at the same time.
+
+    A failing repository does not abort the setup of the other ones; every
+    repository is finished before the results are returned.
+
+    Args:
+        repo_jobs (list): (repository name, repository path, target path) of
+            the repositories to be set up, see setup_repo_class.
+        jobs (int): number of repositories that are set up in parallel.
+        mirror_cache (string): mirror cache directory, None disables the
+            mirror cache.
+        action (function): function that sets up a single repository, it is
+            called with the repository name, path, target path, log and
+            kwargs.
+        resolved (dict): tags or branches of the repositories as resolved by
+            resolve_repos.
+        events (build.EventStream): event stream of the run, None if the
+            events are not recorded.
+
+    Returns:
+        list: (repository name, result) for every repository.
+    """
+    events = events or build.EventStream()
+
+    def _setup(repo_job):
+        repo_name, repo_path, repo_target_path = repo_job
+        log = RepoLog(repo_name, buffered=jobs > 1)
+        _kwargs = dict(kwargs)
+        if mirror_cache:
+            _kwargs['mirror_dir'] = get_mirror_path(mirror_cache, repo_name,
+                                                    repo_path)
+            events.emit('cache', cache='mirror', repo=repo_name,
+                        hits=int(os.path.isdir(_kwargs['mirror_dir'])),
+                        misses=int(not os.path.isdir(_kwargs['mirror_dir'])))
+        if resolved is not None:
+            _kwargs['resolved'] = resolved.get(repo_name)
+        if _kwargs.get('resolved') and _kwargs['resolved'].get('error'):
+            log.error('The tag or branch of \'%s\' could not be resolved',
+                      repo_name)
+            log.flush()
+            events.emit('repo', repo=repo_name, action=action.__name__,
+                        result=REPO_FAILED, duration=0, bytes=0)
+            return repo_name, REPO_FAILED
+        git_dir = os.path.join(repo_target_path, repo_name, '.git')
+        size = get_dir_size(git_dir)
+        start = time.time()
+        try:
+            result = action(repo_name, repo_path, repo_target_path, log,
+                            **_kwargs)
+        except Exception as err:
+            log.error('Setting up \'%s\' failed: %s', repo_name, err)
+            result = REPO_FAILED
+        log.flush()
+        # the growth of the repository is the amount of data received
+        events.emit('repo', repo=repo_name, action=action.__name__,
+                    result=result, duration=round(time.time() - start, 3),
+                    bytes=max(0, get_dir_size(git_dir) - size))
+        return repo_name, result
+
+    if jobs <= 1 or len(repo_jobs) <= 1:
+        return [_setup(repo_job) for repo_job in repo_jobs]
+    pool = ThreadPool(min(jobs, len(repo_jobs)))
+    try:
+        # get() with timeout keeps the main thread responsive to Ctrl+C
+        return pool.map_async(_setup, repo_jobs).get(POOL_TIMEOUT)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def print_summary(results):
+    """Prints the result of the setup of all repositories.
+
+    Args:
+        results (list): (repository name, result) as returned by setup_repos.
+
+    Returns:
+        bool: True if no repository failed.
+    """
+    logging.info(PRINT_MARK)
+    logging.info('Summary')
+    logging.info(PRINT_MARK)
+    failed = [repo for repo, result in results if result == REPO_FAILED]
+    for repo, result in results:
+        if result == REPO_FAILED:
+            logging.error('  %-30s %s', repo, result)
+        else:
+            logging.info('  %-30s %s', repo, result)
+    logging.info(PRINT_MARK)
+    if failed:
+        logging.error('Setting up %d of %d repositories failed: %s',
+                      len(failed), len(results), ', '.join(failed))
+    return not failed
+
+
+def run(args=None, cwd=None):
+    """Sets up a workspace like the command line, but returns the results
+    instead of exiting, so that several workspaces can be set up one after
+    another from one python process.
+
+    The repositories are set up relative to the working directory, so it is
+    changed to the workspace for the duration of the run. Runs in other
+    threads wait for each other (see build.CWD_LOCK).
+
+    Args:
+        args (list): command line arguments, default sys.argv.
+        cwd (string): workspace, default the current directory.
+
+    Returns:
+        dict: the summary of the run (see build.summarize_events) and its
+            'events'.
+    """
+    cmd_line_args = get_parser().parse_args(args)
+    start = time.time()
+    error = None
+    with build.CWD_LOCK:
+        events = build.EventStream(cmd_line_args.events)
+        old_cwd = os.getcwd()
+        try:
+            if cwd:
+                os.chdir(cwd)
+            events.emit('start', tool='bootstrap', args=vars(cmd_line_args),
+                        cwd=os.getcwd())
+            if not setup_workspace(cmd_line_args, events):
+                error = 'setting up the workspace failed'
+        except build.BuildError as err:
+            error = str(err)
+        except Exception as err:
+            logging.exception('Setting up the workspace failed')
+            error = '{}: {}'.format(type(err).__name__, err)
+        finally:
+            os.chdir(old_cwd)
+            run_events = list(events.events)
+            summary = events.emit('summary', **build.summarize_events(
+                'bootstrap', run_events, time.time() - start, error))
+            events.close()
+    return dict(summary, events=run_events)
+
+
+def main(args=None):
+    """Sets up the workspace, see run, and exits with an error if this
+    failed.
+    """
+    if not run(args)['success']:
+        sys.exit(1)
 
 
-def main(cmd_line_args):
+def setup_workspace(cmd_line_args, events=None):
     """Description of t main setup process
      - get all absolute paths of foxBMS repositories
      - clone all repositories or general and specified ones
@@ -260,6 +1219,10 @@ def main(cmd_line_args):
 
     Args:
         cmd_line_args (Namespace): Arguments passed by the command line
+        events (build.EventStream): event stream of the run.
+
+    Returns:
+        bool: True if the workspace was set up.
     """
     if cmd_line_args.verbosity == 1:
         logging.basicConfig(level=logging.INFO)
@@ -268,6 +1231,15 @@ def main(cmd_line_args):
     else:
         logging.basicConfig(level=logging.WARNING)
 
+    if cmd_line_args.documentation_worker:
+        if read_documentation_status().get('state') == DOC_CANCELLED:
+            return False
+        return run_documentation_steps(events)
+    if cmd_line_args.cancel_documentation:
+        return cancel_documentation()
+    if cmd_line_args.open_documentation:
+        return open_documentation(events)
+
     if cmd_line_args.specfiy_software_branch:
         global SW_VERSION
         SW_VERSION = cmd_line_args.specfiy_software_branch
@@ -275,33 +1247,329 @@ def main(cmd_line_args):
         global HW_VERSION
         HW_VERSION = cmd_line_args.specfiy_hardware_branch
 
-    repository_basepath, setup_repo_name = get_main_git_path()
+    mirror_cache = cmd_line_args.mirror_cache
+    if mirror_cache:
+        mirror_cache = os.path.abspath(os.path.expanduser(mirror_cache))
+        if not os.path.isdir(mirror_cache):
+            os.makedirs(mirror_cache)
 
     logging.info(PRINT_MARK)
     logging.info('Setting up the foxBMS project in directory')
     logging.info(os.path.dirname(os.path.realpath(__file__)))
     logging.info(PRINT_MARK)
 
+    if cmd_line_args.from_lock:
+        repo_jobs, locked = read_lock(cmd_line_args.from_lock)
+        results = setup_repos(repo_jobs, cmd_line_args.jobs, mirror_cache,
+                              action=checkout_locked, resolved=locked,
+                              events=events)
+        if not print_summary(results):
+            return False
+        return build_documentation(cmd_line_args, events)
+
+    if cmd_line_args.remote_base:
+        repository_basepath = cmd_line_args.remote_base.rstrip('/')
+    else:
+        repository_basepath, setup_repo_name = get_main_git_path()
+        if repository_basepath is None:
+            return False
+
     # setup general software dependency repositories
     repo_list = read_yaml()
+    repo_jobs = []
     for repos in repo_list:
         yaml_repos_abspath = set_git_paths(repository_basepath, repos[0])
-        setup_repo_class(repos[0], yaml_repos_abspath, repos[1], repos[2])
+        repo_jobs.extend(setup_repo_class(repos[0], yaml_repos_abspath,
+                                          repos[1], repos[2]))
 
     if cmd_line_args.specfiy_repos:
         info = 'specified repositories'
         setup_repo_class(specified_repos, specified_repos_abspath, info)
 
-    if not cmd_line_args.dont_build_documentation:
+    if cmd_line_args.unshallow:
+        results = setup_repos(repo_jobs, cmd_line_args.jobs,
+                              action=unshallow_repo, events=events)
+        return print_summary(results)
+
+    if cmd_line_args.update:
+        resolved = resolve_repos([repo_job for repo_job in repo_jobs if
+                                  os.path.isdir(os.path.join(repo_job[2],
+                                                             repo_job[0]))],
+                                 events)
+        results = setup_repos(repo_jobs, cmd_line_args.jobs, mirror_cache,
+                              action=update_repo, resolved=resolved,
+                              events=events)
+        if mirror_cache:
+            evict_mirrors(mirror_cache, cmd_line_args.mirror_cache_size,
+                          [get_mirror_path(mirror_cache, repo, repo_path)
+                           for repo, repo_path, _path in repo_jobs])
+        if not print_summary(results):
+            return False
+        write_lock(repo_jobs, resolved)
+        return True
+
+    clone_args = {}
+    if cmd_line_args.shallow:
+        clone_args['depth'] = cmd_line_args.depth
+        clone_args['clone_filter'] = cmd_line_args.filter or None
+    resolved = resolve_repos([repo_job for repo_job in repo_jobs if not
+                              os.path.isdir(os.path.join(repo_job[2],
+                                                         repo_job[0]))],
+                             events)
+    results = setup_repos(repo_jobs, cmd_line_args.jobs, mirror_cache,
+                          resolved=resolved, events=events, **clone_args)
+    if mirror_cache:
+        evict_mirrors(mirror_cache, cmd_line_args.mirror_cache_size,
+                      [get_mirror_path(mirror_cache, repo, repo_path)
+                       for repo, repo_path, _path in repo_jobs])
+    if not print_summary(results):
+        return False
+    write_lock(repo_jobs, resolved)
+    return build_documentation(cmd_line_args, events)
+
+
+def read_documentation_status():
+    """Reads the status of the documentation build.
+
+    Returns:
+        dict: the status, empty if no documentation build was started.
+    """
+    try:
+        with open(DOC_STATUS_FILE, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def write_documentation_status(status, **changes):
+    """Updates the status of the documentation build. The file is replaced
+    at once, so that a reader never sees a partially written status.
+
+    Args:
+        status (dict): current status, updated in place.
+        changes: fields to be changed.
+    """
+    status.update(changes)
+    status['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    tmp_file = '{}.{}'.format(DOC_STATUS_FILE, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(status, f, indent=1, sort_keys=True)
+    if os.path.exists(DOC_STATUS_FILE):
+        os.remove(DOC_STATUS_FILE)
+    os.rename(tmp_file, DOC_STATUS_FILE)
+
+
+def run_documentation_steps(events=None):
+    """Builds the documentation step by step (see DOC_STEPS) and records the
+    progress in the status file.
+
+    Args:
+        events (build.EventStream): event stream of the run.
+
+    Returns:
+        bool: True if the documentation was built.
+    """
+    status = read_documentation_status()
+    write_documentation_status(status, state=DOC_RUNNING, pid=os.getpid(),
+                               started=time.strftime('%Y-%m-%d %H:%M:%S'))
+    done = False
+    try:
+        for i, step in enumerate(DOC_STEPS):
+            write_documentation_status(status, progress='{}/{}: {}'.format(
+                i + 1, len(DOC_STEPS), ' '.join(step)))
+            if not build.run(list(step), stream=events)['success']:
+                return False
+        done = True
+        return True
+    finally:
+        # also on an unexpected error or an interrupt, so that the status
+        # does not stay 'running'
+        if done:
+            write_documentation_status(status, state=DOC_DONE, progress=None)
+        else:
+            write_documentation_status(status, state=DOC_FAILED)
+
+
+def process_alive(pid):
+    """Checks if a process is still running.
+    """
+    if sys.platform.startswith('win'):
+        try:
+            out = subprocess.check_output(
+                ['tasklist', '/FI', 'PID eq {}'.format(pid), '/NH'],
+                universal_newlines=True)
+        except (OSError, subprocess.CalledProcessError):
+            return True
+        return str(pid) in out.split()
+    try:
+        # reaps the worker if it was started by this process and has exited
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
+def documentation_running(status):
+    """Checks if the documentation is being built in the background. A
+    status that was left behind by a worker that died is stale.
+
+    Args:
+        status (dict): status as returned by read_documentation_status.
+
+    Returns:
+        bool: True if the worker is queued or running.
+    """
+    if status.get('state') not in [DOC_QUEUED, DOC_RUNNING]:
+        return False
+    if status.get('pid'):
+        return process_alive(status['pid'])
+    # the worker did not write its process id yet
+    return time.time() - status.get('queued', 0) < DOC_START_TIMEOUT
+
+
+def start_documentation_worker():
+    """Starts a detached process that builds the documentation in the
+    background, see run_documentation_steps.
+    """
+    if not os.path.isdir(os.path.dirname(DOC_LOG_FILE)):
+        os.makedirs(os.path.dirname(DOC_LOG_FILE))
+    kwargs = {}
+    if sys.platform.startswith('win'):
+        # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+        kwargs['creationflags'] = 0x00000008 | 0x00000200
+    else:
+        # own process group, so that cancel_documentation stops waf as well
+        kwargs['preexec_fn'] = os.setsid
+        kwargs['close_fds'] = True
+    # written before the worker starts, which then sets its process id and
+    # the state 'running'
+    status = {}
+    write_documentation_status(status, state=DOC_QUEUED, queued=time.time(),
+                               log=DOC_LOG_FILE)
+    try:
+        with open(DOC_LOG_FILE, 'w') as log, \
+                open(os.devnull, 'r') as devnull:
+            proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__),
+                 '--documentation-worker'], stdin=devnull, stdout=log,
+                stderr=subprocess.STDOUT, **kwargs)
+    except OSError:
+        write_documentation_status(status, state=DOC_FAILED)
+        raise
+    logging.warning('The documentation is built in the background (process '
+                    '%s), see %s and %s; stop it with '
+                    '--cancel-documentation', proc.pid, DOC_STATUS_FILE,
+                    DOC_LOG_FILE)
+
+
+def cancel_documentation():
+    """Stops the documentation build in the background, including the waf
+    processes it started.
+
+    Returns:
+        bool: True if a running build was cancelled.
+    """
+    status = read_documentation_status()
+    if not documentation_running(status):
+        logging.warning('No documentation build is running')
+        return False
+    pid = status.get('pid')
+    if not pid:
+        # the worker exits at once when it finds the cancelled state
+        write_documentation_status(status, state=DOC_CANCELLED)
+        logging.warning('Cancelled the documentation build')
+        return True
+    try:
+        if sys.platform.startswith('win'):
+            subprocess.call(['taskkill', '/PID', str(pid), '/T', '/F'])
+        else:
+            os.killpg(pid, signal.SIGTERM)
+    except OSError as err:
+        logging.debug('Could not stop process %s: %s', pid, err)
+    write_documentation_status(status, state=DOC_CANCELLED)
+    logging.warning('Cancelled the documentation build (process %s)', pid)
+    return True
+
+
+def find_documentation_index():
+    """Returns the start page of the sphinx documentation, or None.
+    """
+    for root, dirs, files in os.walk(build.BUILD_DIR):
+        if 'index.html' in files and 'sphinx' in root:
+            return os.path.join(root, 'index.html')
+    return None
+
+
+def open_documentation(events=None):
+    """Opens the documentation in the browser, building it first if this
+    was deferred or did not finish.
+
+    Args:
+        events (build.EventStream): event stream of the run.
+
+    Returns:
+        bool: True if the documentation was opened.
+    """
+    status = read_documentation_status()
+    if documentation_running(status):
+        logging.warning('The documentation is still being built (%s), see '
+                        '%s', status.get('progress'), DOC_STATUS_FILE)
+        return False
+    if status.get('state') in [DOC_QUEUED, DOC_RUNNING]:
+        logging.warning('The documentation build in the background (process '
+                        '%s) did not finish, building it again',
+                        status.get('pid'))
+    if status.get('state') != DOC_DONE and \
+            not run_documentation_steps(events):
+        return False
+    index = find_documentation_index()
+    if not index:
+        logging.error('Could not find the sphinx documentation')
+        return False
+    webbrowser.open('file://' + os.path.abspath(index))
+    return True
+
+
+def build_documentation(cmd_line_args, events=None):
+    """Builds the documentation (sphinx, and Doxygen for both
+    microcontrollers) if not otherwise specified. Depending on the
+    documentation mode it is built at once, in the background or only when
+    it is opened with --open-documentation.
+
+    Args:
+        cmd_line_args (Namespace): Arguments passed by the command line
+        events (build.EventStream): event stream of the run.
+
+    Returns:
+        bool: False if building the documentation failed.
+    """
+    if cmd_line_args.dont_build_documentation:
+        return True
+    if cmd_line_args.documentation_mode == DOC_MODE_BACKGROUND:
+        start_documentation_worker()
+    elif cmd_line_args.documentation_mode == DOC_MODE_LAZY:
+        write_documentation_status({}, state=DOC_PENDING)
+        logging.warning('The documentation is built when it is opened with '
+                        '--open-documentation')
+    else:
         builders = ['--primary', '--secondary', '--doxygen', '--sphinx']
-        build.main(builders)
+        if not build.run(builders, stream=events)['success']:
+            write_documentation_status(read_documentation_status(),
+                                       state=DOC_FAILED)
+            return False
+        write_documentation_status(read_documentation_status(),
+                                   state=DOC_DONE, progress=None)
+    return True
 
 
-if __name__ == '__main__':
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(message)s',
-        formatter_class=argparse.RawDescriptionHelpFormatter)
+def get_parser():
+    """Returns the parser of the command line arguments.
+    """
     HELP_TEXT = '''Setup helper of foxBMS'''
     parser = argparse.ArgumentParser(description=HELP_TEXT, add_help=True)
     opt_args = parser.add_argument_group('optional arguments:')
@@ -314,14 +1582,84 @@ if __name__ == '__main__':
     opt_args.add_argument('-hb', '--specfiy-hardware-branch', type=str,
                           required=False, help='Only the specified repository \
                           will be cloned/fetched')
+    opt_args.add_argument('-j', '--jobs', type=int, default=1,
+                          required=False, help='Number of repositories \
+                          that are cloned and checked out in parallel')
+    opt_args.add_argument('-mc', '--mirror-cache', type=str,
+                          default=os.environ.get(MIRROR_CACHE_ENV),
+                          required=False, help='Directory in which bare \
+                          mirrors of the repositories are kept and cloned \
+                          from (default: ${})'.format(MIRROR_CACHE_ENV))
+    opt_args.add_argument('-mcs', '--mirror-cache-size', type=int,
+                          default=MIRROR_CACHE_SIZE, required=False,
+                          help='Size limit of the mirror cache in MiB, the \
+                          least recently used mirrors are removed when it \
+                          is exceeded, 0 means no limit (default: %(default)s)')
+    opt_args.add_argument('-rb', '--remote-base', type=str, required=False,
+                          help='Base URL of the foxBMS repositories, e.g. \
+                          file:///path/to/bare/repositories (default: \
+                          derived from the remote of this repository)')
+    opt_args.add_argument('--shallow', action='store_true', required=False,
+                          help='Resolve the tag or branch of every \
+                          repository first and clone only this ref with a \
+                          limited history and without unneeded blobs')
+    opt_args.add_argument('--depth', type=int, default=SHALLOW_DEPTH,
+                          required=False, help='History depth of shallow \
+                          clones (default: %(default)s)')
+    opt_args.add_argument('--filter', type=str, default=SHALLOW_FILTER,
+                          required=False, help='Object filter of shallow \
+                          clones, an empty string disables the filter \
+                          (default: %(default)s)')
+    opt_args.add_argument('--unshallow', action='store_true',
+                          required=False, help='Fetch the complete history \
+                          and all branches of shallow cloned repositories')
+    opt_args.add_argument('-u', '--update', action='store_true',
+                          required=False, help='Fast-forward the existing \
+                          repositories whose tag or branch has moved on the \
+                          remote')
+    opt_args.add_argument('-fl', '--from-lock', type=str, nargs='?',
+                          const=LOCK_FILE, required=False, help='Check out \
+                          exactly the commits recorded in the lock file \
+                          (default: {}), using the mirror cache instead of \
+                          the remote if possible'.format(LOCK_FILE))
     opt_args.add_argument('-dbd', '--dont-build-documentation',
                           action='store_true', required=False, help='If specified the \
             documenation will not be build after the checkout process')
+    opt_args.add_argument('-dm', '--documentation-mode', type=str,
+                          choices=[DOC_MODE_NOW, DOC_MODE_BACKGROUND,
+                                   DOC_MODE_LAZY], default=DOC_MODE_NOW,
+                          required=False, help='Build the documentation after \
+                          the checkout ({0}), in a background process \
+                          ({1}) or the first time it is opened ({2}) \
+                          (default: {0})'.format(DOC_MODE_NOW,
+                                                 DOC_MODE_BACKGROUND,
+                                                 DOC_MODE_LAZY))
+    opt_args.add_argument('-od', '--open-documentation', action='store_true',
+                          required=False, help='Open the documentation, \
+                          building it first if it was deferred')
+    opt_args.add_argument('-cd', '--cancel-documentation',
+                          action='store_true', required=False, help='Stop \
+                          the documentation build in the background')
+    opt_args.add_argument('--documentation-worker', action='store_true',
+                          required=False, help=argparse.SUPPRESS)
+    opt_args.add_argument('--events', type=str, metavar='TARGET',
+                          required=False, help='Write the progress as newline \
+                          delimited JSON events (repositories, builds, cache \
+                          statistics and a final summary) to the file \
+                          TARGET, or to the file descriptor N if TARGET is \
+                          fd:N')
     parser.add_argument(
         '--verbosity',
         '-v',
         action='count',
         default=0,
         help='increase output verbosity')
-    CMD_LINE_ARGS = parser.parse_args()
-    main(CMD_LINE_ARGS)
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(message)s',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    main()
@@ -47,57 +47,829 @@ Helper script for building binaries and documentation of foxBMS
 import os
 import sys
 import argparse
+import glob
+import json
+import hashlib
 import logging
+import multiprocessing
+import runpy
+import signal
+import sqlite3
 import subprocess
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 __version__ = 0.2
 __date__ = '2017-11-29'
 __updated__ = '2018-01-25'
 
+BUILD_DIR = 'build'
+CONFIGURE_STAMP = os.path.join(BUILD_DIR, '.configure.sha1')
+"""string: Hash of the configuration inputs of the last successful configure.
+"""
+CONFIGURE_INPUTS = ['wscript', os.path.join('tools', 'waftools')]
+"""list: Files and directories that are read while configuring.
+"""
+SETUP_TARGETS = ['distclean', 'configure']
+"""list: Targets that have to finish before any other target is started.
+"""
+OUTPUT_LOCK = threading.Lock()
+CWD_LOCK = threading.RLock()
+"""lock: Held while the working directory of the process is changed, see
+run_waf_finder.
+"""
+TOOLS_DIR = 'tools'
+WAF_CACHE = os.path.join(BUILD_DIR, '.autodetect_waf.json')
+"""string: Result of autodetect_waf, see get_cached_waf.
+"""
+BUILD_INFO_ENV = 'FOXBMS_BUILD_INFO'
+"""string: Environment variable that enables the build info mode of the
+wscript, which keeps the build number and timestamp out of the configuration.
+"""
+SPHINX_INCREMENTAL_ENV = 'FOXBMS_SPHINX_INCREMENTAL'
+"""string: Environment variable that enables the incremental sphinx build of
+the wscript.
+"""
+TRACE_ENV = 'FOXBMS_TRACE'
+"""string: Environment variable that enables the trace of the waf tasks and
+commands in the wscript.
+"""
+KILL_READ_TIMEOUT = 5
+"""int: Seconds the remaining output of a process is read after it was killed
+on a timeout.
+"""
+TRACE_FILE = os.path.join(BUILD_DIR, 'trace.json')
+"""string: Chrome trace of build.py and all waf processes it started.
+"""
+TRACE_TOP = 15
+"""int: Number of the slowest tasks listed after a traced build.
+"""
+TRACE_EVENTS = []
+SIZE_HISTORY = os.path.join(BUILD_DIR, 'size_history.sqlite')
+"""string: Database of the object and section sizes of all builds, written
+by the size post-build function of the wscript.
+"""
+SIZE_DIFF_TOP = 20
+"""int: Number of objects listed in the size difference report.
+"""
+EVENTS_ENV = 'FOXBMS_EVENTS'
+"""string: Environment variable that makes the waf processes write their
+events (see collect_waf_events).
+"""
+WAF_EVENTS = os.path.join(BUILD_DIR, 'events_{}.json')
+"""string: Events written by the waf process with the given process id.
+"""
 
-def autodetect_waf():
-    waf_finder = os.path.join('tools', 'misc', 'autodetect_waf.py')
-    cmd = '{} {} -r'.format(sys.executable, waf_finder)
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err = proc.communicate()
-    wversion, wpath = out.split(' ')
-    wpath = wpath.replace('\n', '')
-    wpath = wpath[1:-2] # remove leading and trailing braces
-    wpath = os.path.normpath(wpath)
+
+class BuildError(Exception):
+    """Raised if a waf process fails, so that run returns instead of exiting.
+    """
+
+
+class EventStream(object):
+    """Collects the events of a run of build.py or bootstrap.py and writes
+    them as newline delimited JSON, one object per line, to a file or a file
+    descriptor.
+
+    Every event has the fields 'event' and 'time' (seconds since the epoch).
+    Every run has its own stream. A run started by another one (bootstrap.py
+    building the documentation) adds its events to the stream of the outer
+    run.
+
+    Args:
+        target (string): file the events are appended to, 'fd:N' for the
+            open file descriptor N, or None to only collect the events.
+    """
+    def __init__(self, target=None):
+        self.events = []
+        self.out = None
+        self.lock = threading.Lock()
+        if target and target.startswith('fd:'):
+            # the descriptor is duplicated, so that closing the stream leaves
+            # it open for the caller
+            self.out = os.fdopen(os.dup(int(target[3:])), 'w')
+        elif target:
+            self.out = open(target, 'a')
+
+    def emit(self, event, **fields):
+        """Records an event and writes it to the stream.
+
+        Returns:
+            dict: the event.
+        """
+        fields.update(event=event, time=round(time.time(), 3))
+        with self.lock:
+            self.events.append(fields)
+            if self.out:
+                self.out.write(json.dumps(fields, sort_keys=True) + '\n')
+                self.out.flush()
+        return fields
+
+    def close(self):
+        """Closes the file or file descriptor of the stream.
+        """
+        with self.lock:
+            if self.out:
+                self.out.close()
+                self.out = None
+
+
+def collect_waf_events(pid, name, events, cwd=os.curdir):
+    """Adds the events written by a finished waf process (targets and cache
+    statistics) to the event stream of the run.
+
+    Args:
+        pid (int): process id of waf.
+        name (string): name of the target(s) of the process.
+        events (EventStream): event stream of the run.
+        cwd (string): workspace of the process.
+    """
+    path = os.path.join(cwd, WAF_EVENTS.format(pid))
+    try:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+        os.remove(path)
+    except (IOError, OSError):
+        return
+    for line in lines:
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            continue
+        event = fields.pop('event', 'waf')
+        fields.pop('time', None)
+        events.emit(event, process=name, **fields)
+
+
+def summarize_events(tool, events, duration, error=None):
+    """Summarizes the events of a run.
+
+    Args:
+        tool (string): 'build' or 'bootstrap'.
+        events (list): events of the run.
+        duration (float): duration of the run in seconds.
+        error (string): reason why the run failed, None if it succeeded.
+
+    Returns:
+        dict: the summary: success, error, duration, the duration of every
+            waf process and target, the hits and misses of every cache and
+            the result of every repository.
+    """
+    processes = OrderedDict()
+    targets = OrderedDict()
+    caches = OrderedDict()
+    repos = OrderedDict()
+    for event in events:
+        if event['event'] == 'process':
+            processes[event['process']] = round(
+                processes.get(event['process'], 0) + event['duration'], 3)
+        elif event['event'] == 'target':
+            targets[event['target']] = round(
+                targets.get(event['target'], 0) + event['duration'], 3)
+        elif event['event'] == 'cache':
+            cache = caches.setdefault(event['cache'],
+                                      {'hits': 0, 'misses': 0})
+            cache['hits'] += event.get('hits', 0)
+            cache['misses'] += event.get('misses', 0)
+        elif event['event'] == 'repo':
+            repos[event['repo']] = dict(
+                (key, event.get(key)) for key in ['action', 'result',
+                                                  'duration', 'bytes'])
+    for cache in caches.values():
+        lookups = cache['hits'] + cache['misses']
+        cache['hit_rate'] = round(float(cache['hits']) / lookups, 3) \
+            if lookups else None
+    return {'tool': tool, 'success': error is None, 'error': error,
+            'duration': round(duration, 3), 'processes': processes,
+            'targets': targets,
+            'caches': caches, 'repos': repos}
+
+
+def add_trace_event(name, cat, start, end, **args):
+    """Records a phase of build.py in the Chrome trace event format, see
+    write_trace. Only called if the trace is enabled.
+    """
+    thread = threading.current_thread()
+    with OUTPUT_LOCK:
+        TRACE_EVENTS.append({'name': name, 'cat': cat, 'ph': 'X',
+                             'pid': os.getpid(), 'tid': thread.ident,
+                             'ts': int(start * 1e6),
+                             'dur': int((end - start) * 1e6), 'args': args})
+
+
+def write_trace(top=TRACE_TOP, cwd=os.curdir):
+    """Merges the phases of build.py and the traces written by the waf
+    processes into TRACE_FILE and prints the slowest tasks.
+
+    Args:
+        top (int): number of tasks listed.
+        cwd (string): workspace.
+    """
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+               'args': {'name': 'build.py'}}] + TRACE_EVENTS
+    for trace in glob.glob(os.path.join(cwd, BUILD_DIR, 'trace_*.json')):
+        try:
+            with open(trace, 'r') as f:
+                events.extend(json.load(f)['traceEvents'])
+        except (IOError, ValueError, KeyError):
+            logging.warning('Could not read the trace \'%s\'', trace)
+    if not os.path.isdir(os.path.join(cwd, BUILD_DIR)):
+        os.makedirs(os.path.join(cwd, BUILD_DIR))
+    with open(os.path.join(cwd, TRACE_FILE), 'w') as f:
+        json.dump({'traceEvents': events}, f)
+    tasks = [e for e in events if e['ph'] == 'X' and
+             e.get('cat') not in ['phase', 'command']]
+    totals = {}
+    for event in tasks:
+        totals[event['cat']] = totals.get(event['cat'], 0) + event['dur']
+    print('Trace written to {} (open it in chrome://tracing)'.format(
+        TRACE_FILE))
+    print('Slowest tasks:')
+    for event in sorted(tasks, key=lambda e: -e['dur'])[:top]:
+        print('  {:>8.2f} s  {} {}'.format(event['dur'] / 1e6, event['name'],
+                                          event['args'].get('variant', '')))
+    print('Total time by task type:')
+    for cat, dur in sorted(totals.items(), key=lambda item: -item[1]):
+        print('  {:>8.2f} s  {}'.format(dur / 1e6, cat))
+
+
+def run_waf_finder(cwd=os.curdir):
+    """Runs tools/misc/autodetect_waf.py in this interpreter, which prints
+    the waf version and the path of the waf script in braces. The script
+    searches the current directory, so the working directory is changed to
+    the workspace while it runs.
+
+    Args:
+        cwd (string): workspace.
+
+    Returns:
+        string: path of the waf script relative to the workspace.
+
+    Raises:
+        BuildError: if the tools repository is missing or the script does not
+            report a waf script.
+    """
+    waf_finder = os.path.join(TOOLS_DIR, 'misc', 'autodetect_waf.py')
+    if not os.path.isfile(os.path.join(cwd, waf_finder)):
+        raise BuildError('{} not found, run bootstrap.py first'.format(
+            waf_finder))
+    with CWD_LOCK, OUTPUT_LOCK:
+        stdout, argv, old_cwd = sys.stdout, sys.argv, os.getcwd()
+        os.chdir(cwd)
+        sys.stdout, sys.argv = StringIO(), [waf_finder, '-r']
+        try:
+            runpy.run_path(waf_finder, run_name='__main__')
+        except SystemExit:
+            pass
+        finally:
+            out = sys.stdout.getvalue()
+            sys.stdout, sys.argv = stdout, argv
+            os.chdir(old_cwd)
+    try:
+        wversion, wpath = out.strip().split(' ', 1)
+    except ValueError:
+        raise BuildError('{} did not find a waf script'.format(waf_finder))
     logging.debug(wversion)
+    return wpath.strip('()\'", ')
+
+
+def get_waf_cache_key(wpath=None, cwd=os.curdir):
+    """The modification time of TOOLS_DIR changes whenever a waf script is
+    added or removed, the waf script itself is identified by its
+    modification time and size.
+    """
+    key = [os.stat(os.path.join(cwd, TOOLS_DIR)).st_mtime]
+    if wpath:
+        stat = os.stat(os.path.join(cwd, wpath))
+        key.extend([wpath, stat.st_mtime, stat.st_size])
+    return key
+
+
+def get_cached_waf(cwd=os.curdir):
+    """Returns the waf script found by the last autodetect_waf, if TOOLS_DIR
+    and the script did not change since.
+    """
+    try:
+        with open(os.path.join(cwd, WAF_CACHE), 'r') as f:
+            cache = json.load(f)
+        if cache['key'] == get_waf_cache_key(cache['path'], cwd):
+            return cache['path']
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def autodetect_waf(cwd=os.curdir, events=None):
+    events = events or EventStream()
+    wpath = get_cached_waf(cwd)
+    events.emit('cache', cache='waf', hits=int(bool(wpath)),
+                misses=int(not wpath))
+    if wpath:
+        logging.debug('waf (cached): %s', wpath)
+        return wpath
+    wpath = run_waf_finder(cwd)
+    wpath = os.path.normpath(wpath)
     logging.debug(wpath)
+    try:
+        if not os.path.isdir(os.path.join(cwd, BUILD_DIR)):
+            os.makedirs(os.path.join(cwd, BUILD_DIR))
+        with open(os.path.join(cwd, WAF_CACHE), 'w') as f:
+            json.dump({'key': get_waf_cache_key(wpath, cwd), 'path': wpath},
+                      f)
+    except (IOError, OSError) as err:
+        logging.debug('Could not cache the waf path: %s', err)
     return wpath
 
 
-def create_waf_run_string(waf_version, *args):
-    arg_string = ' '.join(args)
-    return '{} {} {}'.format(sys.executable, waf_version, arg_string)
+def get_configure_hash(waf_version, cwd=os.curdir, env=None):
+    """Computes a hash over everything that influences the result of
+    'waf configure': the configuration scripts, the waf script, the python
+    interpreter and the search path of the tools.
+
+    Args:
+        waf_version (string): path of the waf script.
+        cwd (string): workspace.
+        env (dict): environment of the waf processes, default os.environ.
+
+    Returns:
+        string: hex digest of the configuration inputs.
+    """
+    env = os.environ if env is None else env
+    sha = hashlib.sha1()
+    for _item in [waf_version, sys.executable, sys.platform,
+                  env.get('PATH', ''), env.get(BUILD_INFO_ENV, '')]:
+        sha.update(_item.encode('utf-8'))
+    files = []
+    for _input in CONFIGURE_INPUTS:
+        if os.path.isdir(os.path.join(cwd, _input)):
+            for root, dirs, _files in os.walk(os.path.join(cwd, _input)):
+                root = os.path.relpath(root, cwd)
+                files.extend(os.path.join(root, f) for f in _files
+                             if f.endswith('.py'))
+        elif os.path.isfile(os.path.join(cwd, _input)):
+            files.append(_input)
+    for _file in sorted(files):
+        sha.update(_file.encode('utf-8'))
+        with open(os.path.join(cwd, _file), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def get_waf_lockfile(cwd=os.curdir, env=None):
+    """Returns the lock file waf writes in the top directory on configure.
+    """
+    env = os.environ if env is None else env
+    return os.path.join(cwd, env.get('WAFLOCK', '.lock-waf_{}_build'.format(
+        sys.platform)))
 
 
-def start_process(cmd, supress_output=False):
-    """Starts the build process by passing the command string to the
-    command line
+def configure_required(waf_version, cwd=os.curdir, env=None):
+    """Checks if the project has to be configured, that is, if it has never
+    been configured or if any configuration input has changed since the
+    last successful configure.
 
     Args:
-        cmd (string): command for the build process.
-        supress_output (bool): Indicates if logging is active for the build .
+        waf_version (string): path of the waf script.
+        cwd (string): workspace.
+        env (dict): environment of the waf processes, default os.environ.
+
+    Returns:
+        bool: True if 'configure' has to be run.
     """
-    logging.debug(cmd)
-    proc = subprocess.Popen(cmd, stdout=None, stderr=subprocess.PIPE)
-    out, err = proc.communicate()
-    rtn_code = proc.returncode
-
-    if supress_output is False:
-        if out:
-            logging.info(out)
-        if err:
-            logging.error(err)
-
-    if rtn_code == 0 or rtn_code is None:
+    if not os.path.isfile(get_waf_lockfile(cwd, env)):
+        return True
+    try:
+        with open(os.path.join(cwd, CONFIGURE_STAMP), 'r') as f:
+            stamp = f.read().strip()
+    except IOError:
+        return True
+    return stamp != get_configure_hash(waf_version, cwd, env)
+
+
+def write_configure_stamp(waf_version, cwd=os.curdir, env=None):
+    """Stores the hash of the configuration inputs after a successful
+    configure, see configure_required.
+    """
+    if os.path.isdir(os.path.join(cwd, BUILD_DIR)):
+        with open(os.path.join(cwd, CONFIGURE_STAMP), 'w') as f:
+            f.write(get_configure_hash(waf_version, cwd, env))
+
+
+def create_waf_cmd(waf_version, *args):
+    return [sys.executable, waf_version] + list(args)
+
+
+def forward_output(pipe, name, out, log, supress_output=False):
+    """Forwards the output of a process line by line as it arrives, prefixed
+    with the time and the name of the target, and tees it to a log file.
+
+    Args:
+        pipe (file): standard output or standard error of the process.
+        name (string): name of the target(s) of the process.
+        out (file): stream the lines are printed to.
+        log (file): log file, or None.
+        supress_output (bool): if True, the lines are only written to the
+            log file.
+    """
+    for line in iter(pipe.readline, ''):
+        with OUTPUT_LOCK:
+            if log:
+                log.write(line)
+            if not supress_output:
+                out.write('[{} {}] {}'.format(time.strftime('%H:%M:%S'), name,
+                                              line))
+                out.flush()
+    pipe.close()
+
+
+def kill_process_group(proc):
+    """Kills a process started with a timeout by stream_process together
+    with the processes it started (compiler, doxygen), which would otherwise
+    keep running and hold the output pipes open.
+
+    Args:
+        proc (Popen): process that leads its own process group.
+    """
+    try:
+        if sys.platform.startswith('win'):
+            with open(os.devnull, 'w') as devnull:
+                subprocess.call(['taskkill', '/PID', str(proc.pid), '/T',
+                                 '/F'], stdout=devnull, stderr=devnull)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError as err:
+        logging.debug('Could not kill process %s: %s', proc.pid, err)
+
+
+def stream_process(cmd, name, log_file=None, timeout=None,
+                   supress_output=False, cwd=None, env=None, events=None):
+    """Runs a process and streams its standard output and standard error
+    while it is running, see forward_output.
+
+    Args:
+        cmd (list): command and its arguments.
+        name (string): name of the target(s) of the process.
+        log_file (string): file the output is written to, or None.
+        timeout (float): seconds after which the process and all processes
+            it started are killed, or None.
+        supress_output (bool): if True, the output is only written to the
+            log file.
+        cwd (string): working directory of the process, default the current
+            directory.
+        env (dict): environment of the process, default os.environ.
+        events (EventStream): event stream of the run, None if the events
+            are not recorded.
+
+    Returns:
+        int: return code of the process, None if it was killed after the
+            timeout.
+    """
+    events = events or EventStream()
+    logging.debug(' '.join(cmd))
+    start = time.time()
+    log = open(log_file, 'w') if log_file else None
+    kwargs = {}
+    if timeout:
+        # own process group, so that kill_process_group stops the compiler
+        # and doxygen processes of waf as well
+        if sys.platform.startswith('win'):
+            kwargs['creationflags'] = 0x00000200  # CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs['preexec_fn'] = os.setsid
+    try:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True, **kwargs)
+        readers = [threading.Thread(target=forward_output,
+                                    args=(pipe, name, out, log,
+                                          supress_output))
+                   for pipe, out in [(proc.stdout, sys.stdout),
+                                     (proc.stderr, sys.stderr)]]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+        timed_out = []
+        timer = None
+        if timeout:
+            def kill():
+                timed_out.append(True)
+                kill_process_group(proc)
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        try:
+            rtn_code = proc.wait()
+            for reader in readers:
+                # the processes started by waf may still hold the pipes
+                # until the timeout kills them
+                while reader.is_alive() and not timed_out:
+                    reader.join(0.1)
+                # a process that escaped the process group is not waited for
+                reader.join(KILL_READ_TIMEOUT)
+        except KeyboardInterrupt:
+            # the process group does not get the interrupt of the terminal
+            if timer:
+                kill_process_group(proc)
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+    finally:
+        if log:
+            log.close()
+    end = time.time()
+    if (os.environ if env is None else env).get(TRACE_ENV):
+        add_trace_event(name, 'phase', start, end,
+                        targets=' '.join(cmd[2:]), returncode=rtn_code)
+    collect_waf_events(proc.pid, name, events, cwd or os.curdir)
+    events.emit('process', process=name, targets=cmd[2:],
+                duration=round(end - start, 3),
+                returncode=None if timed_out else rtn_code,
+                timed_out=bool(timed_out))
+    if timed_out:
+        logging.error('Error: %s timed out after %s s', name, timeout)
+        return None
+    return rtn_code
+
+
+def start_process(cmd, name='waf', log_file=None, timeout=None,
+                  supress_output=False, cwd=None, env=None, events=None):
+    """Starts the build process and streams its output, see stream_process.
+    Raises BuildError if the process fails.
+
+    Args:
+        cmd (list): command for the build process.
+        name (string): name of the target(s) of the process.
+        log_file (string): file the output is written to, or None.
+        timeout (float): seconds after which the process is killed, or None.
+        supress_output (bool): if True, the output is only written to the
+            log file.
+        cwd (string): working directory of the process.
+        env (dict): environment of the process.
+        events (EventStream): event stream of the run.
+    """
+    rtn_code = stream_process(cmd, name, log_file, timeout, supress_output,
+                              cwd, env, events)
+    if rtn_code == 0:
         logging.info('Success: Process return code %s', str(rtn_code))
     else:
         logging.error('Error: Process return code %s', str(rtn_code))
-        sys.exit(1)
+        raise BuildError('{} failed with return code {}'.format(name,
+                                                                rtn_code))
+
+
+def split_streams(run_list):
+    """Splits the targets into streams that can be built at the same time.
+
+    All targets of a variant share the variant's build directory and waf
+    state, so they are built one after another in one stream. The sphinx
+    documentation is a stream of its own.
+
+    Args:
+        run_list (list): targets without the SETUP_TARGETS.
+
+    Returns:
+        OrderedDict: stream name -> list of targets.
+    """
+    streams = OrderedDict()
+    for targ in run_list:
+        name = targ
+        for prefix in ['clean_', 'build_', 'doxygen_']:
+            if targ.startswith(prefix):
+                name = targ[len(prefix):]
+        streams.setdefault(name, []).append(targ)
+    return streams
+
+
+def share_jobs(streams, jobs, env=None):
+    """Distributes the global job budget on the streams.
+
+    The sphinx stream gets one job unless it is built incrementally with
+    parallel workers, the remaining jobs are shared equally by the other
+    streams.
+
+    Args:
+        streams (OrderedDict): streams as returned by split_streams.
+        jobs (int): global job budget.
+        env (dict): environment of the waf processes, default os.environ.
+
+    Returns:
+        dict: stream name -> number of jobs.
+    """
+    env = os.environ if env is None else env
+    single = [name for name in streams if name == 'sphinx' and
+              not env.get(SPHINX_INCREMENTAL_ENV)]
+    variants = [name for name in streams if name not in single]
+    shared = max(1, (jobs - len(single)) // max(1, len(variants)))
+    stream_jobs = dict((name, 1) for name in single)
+    stream_jobs.update((name, shared) for name in variants)
+    return stream_jobs
+
+
+def get_log_file(name, cwd=os.curdir):
+    """Returns the log file of a target, see stream_process.
+    """
+    if not os.path.isdir(os.path.join(cwd, BUILD_DIR)):
+        os.makedirs(os.path.join(cwd, BUILD_DIR))
+    return os.path.join(cwd, BUILD_DIR, 'output_{}.log'.format(name))
+
+
+def run_stream(waf_version, name, targets, jobs, timeout=None, cwd=None,
+               env=None, events=None):
+    """Runs the targets of a stream in one waf process. The output is
+    streamed with the name of the stream and written to a log file.
+
+    Args:
+        waf_version (string): path of the waf script.
+        name (string): name of the stream.
+        targets (list): targets of the stream.
+        jobs (int): number of parallel waf jobs of this stream.
+        timeout (float): seconds after which the stream is stopped, or None.
+        cwd (string): workspace.
+        env (dict): environment of the waf process.
+        events (EventStream): event stream of the run.
+
+    Returns:
+        int: return code of waf, None on a timeout.
+    """
+    cmd = create_waf_cmd(waf_version, *targets + ['-j', str(jobs)])
+    start = time.time()
+    rtn_code = stream_process(cmd, name, get_log_file(name, cwd or os.curdir),
+                              timeout, cwd=cwd, env=env, events=events)
+    duration = time.time() - start
+    with OUTPUT_LOCK:
+        print('---- {} ({}, {:.1f} s, -j {}) ----'.format(
+            ' '.join(targets), 'ok' if rtn_code == 0 else 'failed',
+            duration, jobs))
+        sys.stdout.flush()
+    return rtn_code
+
+
+def run_parallel(waf_version, run_list, jobs, timeout=None, cwd=None,
+                 env=None, events=None):
+    """Builds independent targets at the same time, sharing one global job
+    budget.
+
+    The SETUP_TARGETS are run first, then every stream (see split_streams)
+    is run in its own waf process.
+
+    Args:
+        waf_version (string): path of the waf script.
+        run_list (list): targets to be built.
+        jobs (int): global job budget.
+        timeout (float): seconds after which a stream is stopped, or None.
+        cwd (string): workspace.
+        env (dict): environment of the waf processes.
+        events (EventStream): event stream of the run.
+    """
+    setup = [targ for targ in run_list if targ in SETUP_TARGETS]
+    if setup:
+        start_process(create_waf_cmd(waf_version, *setup), name='setup',
+                      timeout=timeout, cwd=cwd, env=env, events=events)
+    streams = split_streams([targ for targ in run_list
+                             if targ not in SETUP_TARGETS])
+    if not streams:
+        return
+    stream_jobs = share_jobs(streams, jobs, env)
+    for name, targets in streams.items():
+        logging.info('  - {}: {} (-j {})'.format(name, ', '.join(targets),
+                                                 stream_jobs[name]))
+    pool = ThreadPool(len(streams))
+    try:
+        results = pool.map_async(
+            lambda item: (item[0], run_stream(waf_version, item[0], item[1],
+                                              stream_jobs[item[0]],
+                                              timeout, cwd, env, events)),
+            list(streams.items())).get(24 * 60 * 60)
+    finally:
+        pool.close()
+        pool.join()
+    failed = [name for name, rtn_code in results if rtn_code != 0]
+    if failed:
+        logging.error('Error: Building %s failed', ', '.join(failed))
+        raise BuildError('Building {} failed'.format(', '.join(failed)))
+    logging.info('Success: all targets have been built')
+
+
+def get_size_ref_candidates(ref, cwd=None):
+    """Returns the build numbers a reference given to --size-diff may stand
+    for. Build numbers are short commit hashes, so git references are
+    resolved to their short hash as well.
+
+    Args:
+        ref (string): git reference, build number or build timestamp.
+        cwd (string): workspace.
+
+    Returns:
+        list: build numbers to look for.
+    """
+    candidates = [ref]
+    try:
+        proc = subprocess.Popen(['git', 'rev-parse', '--short', ref],
+                                cwd=cwd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        out, err = proc.communicate()
+        if proc.returncode == 0 and out.strip():
+            candidates.append(out.strip())
+    except OSError:
+        pass
+    return candidates
+
+
+def load_sizes(conn, build_id):
+    """Loads the sizes of one build from the size history.
+
+    Returns:
+        dict: size per (file, member, section).
+    """
+    return dict((row[:3], row[3]) for row in conn.execute(
+        'SELECT o.file, o.member, s.section, s.size FROM sizes s '
+        'JOIN objects o ON o.id = s.object WHERE s.build = ?', (build_id,)))
+
+
+def print_size_diff(variant, base, latest, old, new, top):
+    """Prints the size difference between two builds of a variant.
+    """
+    print('Size difference of {}: {} ({}) -> {} ({})'.format(
+        variant, base[1], base[2], latest[1], latest[2]))
+    diffs = []
+    for key in set(old) | set(new):
+        delta = new.get(key, 0) - old.get(key, 0)
+        if delta:
+            diffs.append((delta, key))
+    elf_diffs = [d for d in diffs if d[1][0].endswith('.elf')]
+    obj_diffs = [d for d in diffs if not d[1][0].endswith('.elf')]
+    print('  ELF sections:')
+    for delta, (_file, member, section) in sorted(
+            elf_diffs, key=lambda d: (d[1][0], d[1][2])):
+        print('    {:>+10} {:>10}  {} {}'.format(
+            delta, new.get((_file, member, section), 0), _file, section))
+    if not elf_diffs:
+        print('    no change')
+    print('  Largest growth by object and section:')
+    for delta, (_file, member, section) in sorted(
+            obj_diffs, key=lambda d: -d[0])[:top]:
+        if delta <= 0:
+            break
+        print('    {:>+10} {:>10}  {}{} {}'.format(
+            delta, new.get((_file, member, section), 0), _file,
+            ' ({})'.format(member) if member else '', section))
+    shrunk = sum(d[0] for d in obj_diffs if d[0] < 0)
+    if shrunk:
+        print('    ({} bytes saved in other objects)'.format(shrunk))
+
+
+def size_diff(ref, top=SIZE_DIFF_TOP, cwd=os.curdir):
+    """Compares the latest build of every variant with the most recent
+    earlier build that matches ref, using the size history only.
+
+    Args:
+        ref (string): git reference, build number or build timestamp.
+        top (int): number of objects listed per variant.
+        cwd (string): workspace.
+
+    Returns:
+        bool: True if a build to compare with was found for any variant.
+    """
+    if not os.path.isfile(os.path.join(cwd, SIZE_HISTORY)):
+        logging.error('No size history found in \'%s\'', SIZE_HISTORY)
+        return False
+    candidates = get_size_ref_candidates(ref, cwd)
+    found = False
+    conn = sqlite3.connect(os.path.join(cwd, SIZE_HISTORY))
+    try:
+        variants = [row[0] for row in conn.execute(
+            'SELECT DISTINCT variant FROM builds ORDER BY variant')]
+        for variant in variants:
+            latest = conn.execute(
+                'SELECT id, buildno, recorded FROM builds WHERE variant = ? '
+                'ORDER BY id DESC LIMIT 1', (variant,)).fetchone()
+            base = conn.execute(
+                'SELECT id, buildno, recorded FROM builds WHERE variant = ? '
+                'AND id < ? AND (buildno IN ({}) OR timestamp LIKE ? OR '
+                'recorded LIKE ?) ORDER BY id DESC LIMIT 1'.format(
+                    ', '.join('?' * len(candidates))),
+                [variant, latest[0]] + candidates + [ref + '%'] * 2
+                ).fetchone()
+            if base is None:
+                logging.warning('No %s build matching \'%s\' in the size '
+                                'history', variant, ref)
+                continue
+            found = True
+            print_size_diff(variant, base, latest, load_sizes(conn, base[0]),
+                            load_sizes(conn, latest[0]), top)
+    finally:
+        conn.close()
+    if not found:
+        logging.error('No build matching \'%s\' in the size history', ref)
+    return found
 
 
 def generate_cmd(variant, build=True, clean=False, doxygen=False):
@@ -111,16 +883,14 @@ def generate_cmd(variant, build=True, clean=False, doxygen=False):
     return jobs
 
 
-def main(args=None):
-    """Based on the input form command line the build/clean string is generated
-    and passed to waf.
+def get_parser():
+    """Returns the parser of the command line arguments.
     """
-    program_name = os.path.basename(sys.argv[0])
     program_version = '{}'.format(__version__)
     program_build_date = str(__updated__)
     program_version_message = '{} {}'.format(
         program_version, program_build_date)
-    program_shortdesc = __import__('__main__').__doc__.split('\n')[1]
+    program_shortdesc = __doc__.split('\n')[1]
     program_license = '''{}
 
     Created by the foxBMS Team on {}.
@@ -183,6 +953,15 @@ USAGE
         required=False,
         help='builds the general sphinx documenation')
 
+    bld_args.add_argument(
+        '-si',
+        '--sphinx-incremental',
+        action='store_true',
+        required=False,
+        help='builds the sphinx documentation with parallel workers and \
+keeps its doctrees, so that only changed pages are rebuilt (sets ${})\
+'.format(SPHINX_INCREMENTAL_ENV))
+
     bld_args.add_argument(
         '-a',
         '--all',
@@ -205,6 +984,68 @@ general sphinx documentation'.format(build_tgt.items()))
         help='Removes the build directory and lock file. The project is \
 reconfigured afterwards')
 
+    bld_args.add_argument(
+        '-P',
+        '--parallel',
+        action='store_true',
+        required=False,
+        help='Builds the variants and the sphinx documentation at the same \
+time, sharing the job budget given by --jobs')
+
+    bld_args.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        required=False,
+        help='Number of parallel jobs used by all targets together \
+(default: %(default)s)')
+
+    bld_args.add_argument(
+        '-t',
+        '--timeout',
+        type=float,
+        required=False,
+        help='Stops a waf process and the compiler and doxygen processes it \
+started when it runs longer than TIMEOUT seconds. \
+The timeout and the log file build/output_<name>.log apply to a waf process, \
+which builds several targets: in the sequential mode all targets except \
+distclean and the doxygen documentation are built by one process (build), \
+with --parallel every variant and the sphinx documentation have their own \
+process')
+
+    bld_args.add_argument(
+        '-bi',
+        '--build-info',
+        action='store_true',
+        required=False,
+        help='Generates the build number and timestamp at build time into a \
+single source file instead of the configuration, so that a new commit only \
+rebuilds that file (sets ${})'.format(BUILD_INFO_ENV))
+
+    bld_args.add_argument(
+        '--trace',
+        action='store_true',
+        required=False,
+        help='Records the phases of build.py and every waf task in {} and \
+lists the slowest tasks (sets ${})'.format(TRACE_FILE, TRACE_ENV))
+
+    bld_args.add_argument(
+        '--size-diff',
+        metavar='REF',
+        required=False,
+        help='Reports the largest size growth of the latest build compared \
+to the build REF (git reference, build number or timestamp) from the size \
+history in {}'.format(SIZE_HISTORY))
+
+    bld_args.add_argument(
+        '--size-diff-top',
+        type=int,
+        default=SIZE_DIFF_TOP,
+        required=False,
+        help='Number of objects listed by --size-diff (default: \
+%(default)s)')
+
     bld_args.add_argument(
         '-nobld',
         '--nobuild',
@@ -213,8 +1054,78 @@ reconfigured afterwards')
         required=False,
         help='If specified, then no rebuild after cleaning will be triggered.')
 
-    args = parser.parse_args(args)
+    bld_args.add_argument(
+        '--events',
+        metavar='TARGET',
+        required=False,
+        help='Writes the progress as newline delimited JSON events (targets, \
+processes, cache statistics and a final summary) to the file TARGET, or to \
+the file descriptor N if TARGET is fd:N')
+
+    return parser
+
 
+def run(args=None, cwd=None, stream=None):
+    """Builds like the command line, but returns the results instead of
+    exiting, so that several workspaces can be built from one python
+    process. The working directory and the environment of the process are
+    left unchanged, the waf processes get them passed, and every run has its
+    own event stream.
+
+    Args:
+        args (list): command line arguments, default sys.argv.
+        cwd (string): workspace, default the current directory.
+        stream (EventStream): event stream of an outer run (bootstrap.py)
+            the events are added to. If None, a new stream is written to the
+            target of --events.
+
+    Returns:
+        dict: the summary of the run (see summarize_events) and its
+            'events'.
+    """
+    args = get_parser().parse_args(args)
+    cwd = os.path.abspath(cwd or os.getcwd())
+    start = time.time()
+    events = stream or EventStream(args.events)
+    first = len(events.events)
+    error = None
+    try:
+        events.emit('start', tool='build', args=vars(args), cwd=cwd)
+        if not build_workspace(args, cwd, events):
+            error = 'size difference report failed'
+    except BuildError as err:
+        error = str(err)
+    except Exception as err:
+        logging.exception('Build failed')
+        error = '{}: {}'.format(type(err).__name__, err)
+    finally:
+        run_events = events.events[first:]
+        summary = events.emit('summary', **summarize_events(
+            'build', run_events, time.time() - start, error))
+        if not stream:
+            events.close()
+    return dict(summary, events=run_events)
+
+
+def main(args=None):
+    """Based on the input form command line the build/clean string is generated
+    and passed to waf.
+    """
+    if not run(args)['success']:
+        sys.exit(1)
+
+
+def build_workspace(args, cwd, events):
+    """Runs the targets selected by the command line arguments.
+
+    Args:
+        args (Namespace): parsed command line arguments.
+        cwd (string): workspace.
+        events (EventStream): event stream of the run.
+
+    Returns:
+        bool: False if the requested size difference report failed.
+    """
     if args.verbosity == 1:
         logging.basicConfig(level=logging.INFO)
     elif args.verbosity > 1:
@@ -222,16 +1133,61 @@ reconfigured afterwards')
     else:
         logging.basicConfig(level=logging.ERROR)
 
-    rebuild = True
-    if args.nobuild:
-        rebuild = False
+    if args.size_diff and not (args.conf or args.distclean or args.all or
+                               args.primary or args.secondary or
+                               args.bootloader or args.sphinx or args.clean):
+        # only the report is requested, nothing has to be built
+        return size_diff(args.size_diff, args.size_diff_top, cwd)
+
+    env = dict(os.environ)
+    if args.build_info:
+        env[BUILD_INFO_ENV] = '1'
+    if args.sphinx_incremental:
+        env[SPHINX_INCREMENTAL_ENV] = '1'
+    if args.trace:
+        env[TRACE_ENV] = '1'
+        for trace in glob.glob(os.path.join(cwd, BUILD_DIR, 'trace_*.json')):
+            os.remove(trace)
+        del TRACE_EVENTS[:]
+    if events.out:
+        # the events are written to a file by this or an outer run
+        env[EVENTS_ENV] = '1'
+    try:
+        return run_targets(args, cwd, env, events)
+    finally:
+        if args.trace:
+            write_trace(cwd=cwd)
+
 
-    used_waf_version = autodetect_waf()
+def run_targets(args, cwd, env, events):
+    """Runs waf for the targets selected by the command line arguments, see
+    build_workspace.
+
+    Args:
+        args (Namespace): parsed command line arguments.
+        cwd (string): workspace.
+        env (dict): environment of the waf processes.
+        events (EventStream): event stream of the run.
+    """
+    rebuild = not args.nobuild
+
+    start = time.time()
+    used_waf_version = autodetect_waf(cwd, events)
+    if args.trace:
+        add_trace_event('autodetect_waf', 'phase', start, time.time())
 
     run_list = []
     if args.distclean:
         run_list.append('distclean')
-    run_list.append('configure')
+    configure = args.conf or args.distclean or \
+        configure_required(used_waf_version, cwd, env)
+    if configure:
+        run_list.append('configure')
+    else:
+        logging.info('Configuration is up to date, skipping \'configure\'')
+    if not (args.conf or args.distclean):
+        events.emit('cache', cache='configure', hits=int(not configure),
+                    misses=int(configure))
 
     if args.all:
         args.primary = True
@@ -265,19 +1221,48 @@ reconfigured afterwards')
     if args.sphinx:
         run_list.append('sphinx')
     logging.info('Building following targets:')
-    for targ in run_list[1:]:
+    for targ in run_list:
         logging.info('  - {}'.format(targ))
 
-    exec_cmd = [
-        create_waf_run_string(
-            used_waf_version,
-            targ) for targ in run_list]
-    logging.info('Created run string for following targets:')
-    for _cmd in exec_cmd:
-        logging.info('  - {}'.format(_cmd))
+    if args.parallel:
+        run_parallel(used_waf_version, run_list, args.jobs, args.timeout,
+                     cwd, env, events)
+    else:
+        if 'distclean' in run_list:
+            # distclean removes the build directory with the log file
+            run_list.remove('distclean')
+            start_process(create_waf_cmd(used_waf_version, 'distclean'),
+                          name='distclean', timeout=args.timeout, cwd=cwd,
+                          env=env, events=events)
+        # the documentation of several variants is generated at the same
+        # time after all other targets
+        doxygen_targets = [targ for targ in run_list
+                           if targ.startswith('doxygen_')]
+        if len(doxygen_targets) > 1:
+            run_list = [targ for targ in run_list
+                        if targ not in doxygen_targets]
+        else:
+            doxygen_targets = []
+        if run_list:
+            # all other targets are passed to a single waf process, so that
+            # waf and the configuration cache are loaded only once
+            exec_cmd = create_waf_cmd(used_waf_version, *run_list +
+                                      ['-j', str(args.jobs)])
+            logging.info('Created run string:')
+            logging.info('  - {}'.format(' '.join(exec_cmd)))
 
-    for _cmd in exec_cmd:
-        start_process(_cmd)
+            start_process(exec_cmd, name='build',
+                          log_file=get_log_file('build', cwd),
+                          timeout=args.timeout, cwd=cwd, env=env,
+                          events=events)
+        if doxygen_targets:
+            run_parallel(used_waf_version, doxygen_targets, args.jobs,
+                         args.timeout, cwd, env, events)
+    if configure:
+        write_configure_stamp(used_waf_version, cwd, env)
+    if args.size_diff:
+        size_diff(args.size_diff, args.size_diff_top, cwd)
+    return True
 
 
 if __name__ == '__main__':